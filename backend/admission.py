@@ -0,0 +1,196 @@
+"""
+OpoCalendar Admission Control Module
+Control de admisión por clase de ruta: límite de concurrencia, cola acotada
+con plazo máximo de espera y 503 + Retry-After inmediato al saturarse.
+
+Clases:
+    read      GET/HEAD baratos (/tasks)
+    write     mutaciones de tareas
+    optimize  /optimize/* (CPU)
+    auth      /auth/login y /auth/register (bcrypt)
+
+Cada clase se configura con ADMISSION_<CLASE>_CONCURRENCY, _QUEUE y _TIMEOUT
+(segundos de espera máxima en cola). ADMISSION_ENABLED=0 lo desactiva.
+
+Los handlers y dependencias síncronos se ejecutan en el threadpool de anyio
+(40 hilos por defecto) y cada petición admitida ocupa como mucho un hilo a la
+vez. La suma de concurrencias por defecto (38) queda por debajo de ese tamaño,
+así que una clase saturada no deja sin hilos a las demás; si se suben los
+límites, hay que subir también el threadpool.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+
+import metrics
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# (concurrencia, tamaño de cola, espera máxima en segundos)
+DEFAULT_LIMITS = {
+    "read": (16, 256, 2.0),
+    "write": (16, 64, 3.0),
+    "optimize": (2, 8, 5.0),
+    "auth": (4, 16, 3.0),
+}
+
+# Rutas que nunca se rechazan (sondas y observabilidad)
+EXEMPT_PREFIXES = ("/health", "/metrics", "/admin/")
+
+ADMISSION_REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    "admission_requests_total", "Decisiones de admisión por clase", ("class", "outcome")))
+ADMISSION_IN_FLIGHT = metrics.REGISTRY.register(metrics.Gauge(
+    "admission_in_flight", "Peticiones en ejecución por clase", ("class",)))
+ADMISSION_QUEUE_DEPTH = metrics.REGISTRY.register(metrics.Gauge(
+    "admission_queue_depth", "Peticiones esperando en cola por clase", ("class",)))
+ADMISSION_QUEUE_WAIT = metrics.REGISTRY.register(metrics.Histogram(
+    "admission_queue_wait_seconds", "Tiempo de espera en cola antes de ser admitida", ("class",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)))
+
+
+def route_class(method: str, path: str):
+    """Clase de admisión de una petición (None = exenta)."""
+    if method == "OPTIONS" or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path.startswith("/optimize/"):
+        return "optimize"
+    if path in ("/auth/login", "/auth/register"):
+        return "auth"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Gate:
+    """Semáforo con cola FIFO acotada y plazo de espera (un event loop por worker)."""
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiters = deque()
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.timeout))
+
+    def _publish(self):
+        ADMISSION_IN_FLIGHT.set(self.active, self.name)
+        ADMISSION_QUEUE_DEPTH.set(len(self.waiters), self.name)
+
+    async def acquire(self):
+        """Ocupa una plaza o levanta Rejected ('queue_full' / 'timeout')."""
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self._publish()
+            ADMISSION_QUEUE_WAIT.observe(0.0, self.name)
+            return
+        if len(self.waiters) >= self.queue_size:
+            raise Rejected("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self._publish()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({waiter}, timeout=self.timeout)
+        except asyncio.CancelledError:
+            # Cliente desconectado: devolver la plaza si ya se nos había cedido
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._drop(waiter)
+            raise
+        if not waiter.done():
+            self._drop(waiter)
+            raise Rejected("timeout")
+        # release() nos ha cedido su plaza: active no cambia
+        ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - started, self.name)
+        self._publish()
+
+    def _drop(self, waiter):
+        waiter.cancel()
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._publish()
+
+    def release(self):
+        """Libera una plaza, cediéndola directamente al primer waiter vivo."""
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+
+def _limits_from_env(name: str, defaults):
+    prefix = f"ADMISSION_{name.upper()}_"
+    concurrency, queue, timeout = defaults
+    return (
+        int(os.getenv(prefix + "CONCURRENCY", concurrency)),
+        int(os.getenv(prefix + "QUEUE", queue)),
+        float(os.getenv(prefix + "TIMEOUT", timeout)),
+    )
+
+
+def build_gates() -> dict:
+    return {name: Gate(name, *_limits_from_env(name, limits)) for name, limits in DEFAULT_LIMITS.items()}
+
+
+_REJECTION_BODY = json.dumps({"detail": "Servidor saturado. Intenta de nuevo en unos segundos."}).encode()
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI puro que aplica el control de admisión por clase."""
+
+    def __init__(self, app, gates: dict = None):
+        self.app = app
+        self.gates = gates or build_gates()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        gate = self.gates[name]
+        try:
+            await gate.acquire()
+        except Rejected as exc:
+            ADMISSION_REQUESTS.inc(name, exc.reason)
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(_REJECTION_BODY)).encode()),
+                    (b"retry-after", str(gate.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": _REJECTION_BODY})
+            return
+
+        ADMISSION_REQUESTS.inc(name, "admitted")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
@@ -1,6 +1,24 @@
 from datetime import datetime, timedelta, time, date
+from typing import Optional
+import time as _time
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-import models, schemas
+import models, schemas, metrics
+
+# Peso numérico de cada prioridad (mayor = se coloca antes)
+PRIORITY_RANK = {"high": 3, "medium": 2, "low": 1}
+
+# Columnas estrictamente necesarias para el optimizador (sin ORM)
+_tasks_table = models.Task.__table__
+_SCHEDULE_COLUMNS = (
+    _tasks_table.c.id,
+    _tasks_table.c.title,
+    _tasks_table.c.priority,
+    _tasks_table.c.duration,
+    _tasks_table.c.is_fixed,
+    _tasks_table.c.start_time,
+    _tasks_table.c.end_time,
+)
 
 # --- HELPERS ---
 def time_to_minutes(t: time) -> int:
@@ -20,14 +38,63 @@ def parse_time_str(t_str: str) -> int:
     except:
         return 0
 
-# --- LÓGICA PRINCIPAL ---
-def calculate_schedule(db: Session, target_date: date, request: schemas.OptimizationRequest):
-    # 1. Obtener tareas del día
-    tasks = db.query(models.Task).filter(
-        models.Task.date == target_date,
-        models.Task.completed == False
-    ).all()
+# --- CARGA LIGERA ---
+class TaskSlot:
+    """Vista compacta de una tarea para el optimizador (tiempos en minutos)."""
+    __slots__ = ("id", "title", "rank", "duration", "is_fixed", "start", "end", "old_start")
+
+    def __init__(self, id, title, rank, duration, is_fixed, start, end, old_start):
+        self.id = id
+        self.title = title
+        self.rank = rank
+        self.duration = duration
+        self.is_fixed = is_fixed
+        self.start = start
+        self.end = end
+        self.old_start = old_start
+
+def load_day_tasks(db: Session, target_date: date, user_id: Optional[int] = None) -> list[TaskSlot]:
+    """
+    Carga las tareas pendientes del día proyectando solo las columnas necesarias.
+    Usa SQLAlchemy Core: sin identity map ni atributos instrumentados.
+    """
+    stmt = select(*_SCHEDULE_COLUMNS).where(
+        _tasks_table.c.date == target_date,
+        _tasks_table.c.completed == False
+    )
+    if user_id is not None:
+        stmt = stmt.where(_tasks_table.c.user_id == user_id)
+
+    slots = []
+    for task_id, title, priority, duration, is_fixed, start_time, end_time in db.execute(stmt):
+        prio = priority.value if priority is not None else "medium"
+        slots.append(TaskSlot(
+            task_id,
+            title,
+            PRIORITY_RANK.get(prio, 1),
+            duration,
+            bool(is_fixed),
+            start_time.hour * 60 + start_time.minute,
+            end_time.hour * 60 + end_time.minute,
+            start_time,
+        ))
+    return slots
 
+# --- LÓGICA PRINCIPAL ---
+def calculate_schedule(db: Session, target_date: date, request: schemas.OptimizationRequest, user_id: Optional[int] = None):
+    started = _time.perf_counter()
+    # 1. Obtener tareas del día (proyección ligera, ya en minutos)
+    tasks = load_day_tasks(db, target_date, user_id=user_id)
+    metrics.OPTIMIZER_TASKS.observe(len(tasks))
+    try:
+        proposals = fill_gaps(tasks, request)
+    finally:
+        metrics.OPTIMIZER_SOLVE_SECONDS.observe(_time.perf_counter() - started)
+    metrics.OPTIMIZER_PROPOSALS.observe(len(proposals))
+    return proposals
+
+def fill_gaps(tasks: list[TaskSlot], request: schemas.OptimizationRequest):
+    """Rellena los huecos libres del día con las tareas flexibles (sin acceso a BD)."""
     if not tasks:
         return []
 
@@ -45,8 +112,8 @@ def calculate_schedule(db: Session, target_date: date, request: schemas.Optimiza
     for t in tasks:
         if t.is_fixed:
             fixed_blocks.append({
-                "start": time_to_minutes(t.start_time),
-                "end": time_to_minutes(t.end_time),
+                "start": t.start,
+                "end": t.end,
                 "type": "fixed_task"
             })
 
@@ -63,8 +130,7 @@ def calculate_schedule(db: Session, target_date: date, request: schemas.Optimiza
 
     # Flexibles a organizar
     flexible_tasks = [t for t in tasks if not t.is_fixed]
-    prio_val = {"high": 3, "medium": 2, "low": 1}
-    flexible_tasks.sort(key=lambda x: (prio_val.get(x.priority.value, 1), x.duration), reverse=True)
+    flexible_tasks.sort(key=lambda x: (x.rank, x.duration), reverse=True)
 
     current_time = day_start
     proposals = []
@@ -97,7 +163,7 @@ def calculate_schedule(db: Session, target_date: date, request: schemas.Optimiza
                     proposals.append({
                         "task_id": task.id,
                         "title": task.title,
-                        "old_start": task.start_time,
+                        "old_start": task.old_start,
                         "new_start": minutes_to_time(new_start_min),
                         "new_end": minutes_to_time(new_end_min)
                     })
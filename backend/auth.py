@@ -3,7 +3,7 @@ OpoCalendar Authentication Module
 Maneja autenticación JWT y gestión de usuarios con cifrado de datos sensibles
 """
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthCredentials
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Optional
@@ -67,7 +67,7 @@ def create_refresh_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthCredentials = Depends(security)) -> dict:
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """
     Valida el token JWT y retorna los datos del usuario.
     Levanta HTTPException si el token es inválido.
@@ -75,21 +75,36 @@ async def get_current_user(credentials: HTTPAuthCredentials = Depends(security))
     token = credentials.credentials
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
+        user_id = payload.get("sub")  # JWT exige que "sub" sea una cadena
         if user_id is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token inválido",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return {"user_id": user_id, "username": payload.get("username")}
-    except JWTError:
+        return {"user_id": int(user_id), "username": payload.get("username")}
+    except (JWTError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token expirado o inválido",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def user_id_from_authorization(authorization: str) -> Optional[str]:
+    """
+    Extrae el user_id (sub) de una cabecera 'Bearer <token>'.
+    Devuelve None si falta o no es válido (no levanta excepciones).
+    """
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id = payload.get("sub")
+    return str(user_id) if user_id is not None else None
+
 def validate_input(value: str, field_name: str, max_length: int = 255) -> str:
     """
     Valida y sanitiza entrada de usuario.
@@ -115,7 +130,7 @@ def validate_input(value: str, field_name: str, max_length: int = 255) -> str:
     
     # Elimina caracteres peligrosos comunes
     dangerous_patterns = [
-        r"('"|\")",  # Comillas
+        r"('|\")",  # Comillas
         r"(--|;)",    # SQL comments
         r"(\*/|/\*)",  # Block comments
         r"(xp_|sp_)",  # SQL Server procs
@@ -0,0 +1,4 @@
+"""
+Benchmarks de rendimiento del backend.
+Ejecutar desde backend/: python -m benchmarks.<modulo>
+"""
@@ -0,0 +1,59 @@
+"""
+Microbenchmarks de auth: emisión y validación de tokens, hash de contraseñas.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_auth --repeat 200
+"""
+import argparse
+import os
+from datetime import timedelta
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-no-usar-en-produccion")
+
+from benchmarks.common import add_timing, print_table
+
+import auth
+from fastapi.security import HTTPAuthorizationCredentials
+
+
+def _run_coroutine(coro):
+    """Ejecuta una corrutina sin awaits reales (evita el coste del event loop)."""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("La corrutina se suspendió")
+
+
+def run(repeat: int = 200, hash_repeat: int = 5) -> dict:
+    token = auth.create_access_token({"sub": "1", "username": "bench"}, expires_delta=timedelta(minutes=30))
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    benches = {
+        "create_access_token": (lambda: auth.create_access_token({"sub": "1", "username": "bench"}), repeat),
+        "create_refresh_token": (lambda: auth.create_refresh_token({"sub": "1"}), repeat),
+        "get_current_user": (lambda: _run_coroutine(auth.get_current_user(credentials)), repeat),
+        "validate_input": (lambda: auth.validate_input("usuario_bench", "Usuario", max_length=50), repeat),
+    }
+    results = {}
+    for name, (fn, times) in benches.items():
+        add_timing(results, f"auth.{name}", fn, times)
+
+    # bcrypt es deliberadamente lento: pocas repeticiones
+    password = "contraseña-benchmark"
+    if add_timing(results, "auth.get_password_hash", lambda: auth.get_password_hash(password), hash_repeat):
+        hashed = auth.get_password_hash(password)
+        add_timing(results, "auth.verify_password", lambda: auth.verify_password(password, hashed), hash_repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--hash-repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print_table(run(args.repeat, args.hash_repeat))
+
+
+if __name__ == "__main__":
+    main()
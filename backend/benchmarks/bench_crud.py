@@ -0,0 +1,63 @@
+"""
+Microbenchmarks de crud: lecturas y escrituras sobre SQLite en memoria.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_crud --tasks 10 100 1000 --repeat 50
+"""
+import argparse
+import itertools
+
+from benchmarks.generators import TARGET_DATE, seed_database
+from benchmarks.common import add_timing, print_table
+
+import crud, schemas
+
+NEW_TASK = schemas.TaskCreate(
+    title="Tarea benchmark",
+    description="Creada por bench_crud",
+    type="study",
+    priority="medium",
+    date=TARGET_DATE,
+    start_time="09:00:00",
+    end_time="10:00:00",
+    duration=60,
+)
+UPDATE = schemas.TaskUpdate(title="Tarea benchmark editada", completed=True)
+
+
+def run(scales=(10, 100, 1000), repeat: int = 50) -> dict:
+    results = {}
+    for n in scales:
+        Session = seed_database(n)
+        db = Session()
+        ids = itertools.cycle(range(1, n + 1))
+        try:
+            benches = {
+                "get_tasks": (lambda: crud.get_tasks(db, user_id=1), max(1, min(repeat, 20_000 // n))),
+                "get_task": (lambda: crud.get_task(db, next(ids), user_id=1), repeat),
+                "update_task": (lambda: crud.update_task(db, next(ids), UPDATE, user_id=1), repeat),
+                "create_task": (lambda: crud.create_task(db, NEW_TASK, user_id=1), repeat),
+            }
+            for name, (fn, times) in benches.items():
+                add_timing(results, f"crud.{name}[{n}]", fn, times)
+                db.expunge_all()
+
+            # Borra las tareas recién creadas por create_task (warmup incluido)
+            created = iter(range(n + 1, n + 1 + repeat + 1))
+            add_timing(results, f"crud.delete_task[{n}]", lambda: crud.delete_task(db, next(created), user_id=1), repeat)
+        finally:
+            db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print_table(run(args.tasks, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
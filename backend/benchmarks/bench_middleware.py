@@ -0,0 +1,117 @@
+"""
+Overhead por petición de la pila de middleware: BaseHTTPMiddleware + GZip de
+Starlette (anterior) frente a los middleware ASGI puros de middleware.py.
+
+Cada pila se mide alternando petición a petición con la app sin middleware
+(bare), y se guarda el overhead: p50 de la pila menos p50 de bare. Las filas
+bare y legacy son de referencia y no cuentan como regresión.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_middleware --requests 5000
+"""
+import argparse
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from benchmarks.common import summarize, result, print_table
+from middleware import CompressionMiddleware, SecurityHeadersMiddleware, SECURITY_HEADERS
+
+SMALL = {"status": "healthy", "version": "2.0.0"}
+LARGE = [{"id": i, "title": f"Tarea {i}", "description": "Descripción " * 10} for i in range(100)]
+
+
+def _inner_app():
+    async def small(request):
+        return JSONResponse(SMALL)
+
+    async def large(request):
+        return JSONResponse(LARGE)
+
+    return Starlette(routes=[Route("/small", small), Route("/large", large)])
+
+
+def legacy_stack():
+    """Pila anterior: @app.middleware("http") para cabeceras + GZipMiddleware."""
+    async def add_security_headers(request, call_next):
+        response = await call_next(request)
+        for name, value in SECURITY_HEADERS.items():
+            response.headers[name] = value
+        return response
+
+    app = GZipMiddleware(_inner_app(), minimum_size=1000)
+    return BaseHTTPMiddleware(app, dispatch=add_security_headers)
+
+
+def asgi_stack():
+    return SecurityHeadersMiddleware(CompressionMiddleware(_inner_app(), minimum_size=1000))
+
+
+STACKS = {
+    "bare": _inner_app,
+    "legacy": legacy_stack,
+    "asgi": asgi_stack,
+}
+
+
+async def _drive(apps: list, path: str, accept_encoding: bytes, total: int) -> list[list[float]]:
+    """Muestras (ms) de cada app, alternándolas para que el ruido les afecte por igual."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"localhost"), (b"accept-encoding", accept_encoding)],
+        "client": ("127.0.0.1", 1234), "server": ("localhost", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    samples = [[] for _ in apps]
+    for _ in range(total):
+        for app, app_samples in zip(apps, samples):
+            t0 = time.perf_counter()
+            await app(dict(scope), receive, send)
+            app_samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def run(total: int = 3000) -> dict:
+    results = {}
+    for payload in ("small", "large"):
+        for encoding in (b"gzip", b"zstd, gzip"):
+            label = encoding.split(b",")[0].decode()
+            # Cada pila se empareja solo con bare: intercalar legacy (pesada) con
+            # asgi ensuciaría las cachés y la medida de asgi
+            for name in ("asgi", "legacy"):
+                if name == "legacy" and encoding != b"gzip":
+                    continue  # GZipMiddleware no negocia zstd
+                apps = [STACKS["bare"](), STACKS[name]()]
+                asyncio.run(_drive(apps, f"/{payload}", encoding, max(200, total // 10)))  # warmup
+                bare, stack = map(summarize, asyncio.run(_drive(apps, f"/{payload}", encoding, total)))
+                bare_us, p50_us = bare["p50_ms"] * 1000, stack["p50_ms"] * 1000
+                if name == "asgi":
+                    results[f"middleware.bare.{payload}.{label}"] = result(bare_us, unit="us/req", gate=False, **bare)
+                results[f"middleware.{name}.{payload}.{label}"] = result(
+                    p50_us - bare_us, unit="us/req overhead", gate=name == "asgi",
+                    p50_us=round(p50_us, 2), bare_p50_us=round(bare_us, 2), **stack)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    print_table(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark del optimizador: carga ORM completa vs proyección Core, y solve
+completo por ambos caminos (el anterior sobre entidades ORM y el actual).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_optimizer --tasks 10 100 1000 --repeat 20
+"""
+import argparse
+import tracemalloc
+
+from benchmarks.generators import TARGET_DATE, seed_database
+from benchmarks.common import time_calls, result
+
+import models, schemas, ai_service
+
+REQUEST = schemas.OptimizationRequest(
+    day_start="08:00", day_end="22:00",
+    breaks=[schemas.BreakInterval(start_time="14:00", end_time="15:00")],
+)
+
+
+def orm_load(db, target_date, user_id=None):
+    """Ruta anterior: entidades ORM completas + conversión objeto a objeto."""
+    query = db.query(models.Task).filter(
+        models.Task.date == target_date,
+        models.Task.completed == False
+    )
+    if user_id is not None:
+        query = query.filter(models.Task.user_id == user_id)
+    return [
+        ai_service.TaskSlot(
+            t.id, t.title, ai_service.PRIORITY_RANK.get(t.priority.value, 1), t.duration, t.is_fixed,
+            ai_service.time_to_minutes(t.start_time), ai_service.time_to_minutes(t.end_time), t.start_time,
+        )
+        for t in query.all()
+    ]
+
+
+def orm_solve(db, target_date, request, user_id=None):
+    """
+    Ruta anterior completa (calculate_schedule antes de la proyección Core):
+    entidades ORM y minutos calculados desde los datetime.time en el propio
+    relleno de huecos. Se conserva tal cual como referencia del benchmark.
+    """
+    query = db.query(models.Task).filter(
+        models.Task.date == target_date,
+        models.Task.completed == False
+    )
+    if user_id is not None:
+        query = query.filter(models.Task.user_id == user_id)
+    tasks = query.all()
+    if not tasks:
+        return []
+
+    day_start = ai_service.parse_time_str(request.day_start)
+    day_end = ai_service.parse_time_str(request.day_end)
+    if day_end <= day_start:
+        day_start, day_end = 480, 1320
+
+    fixed_blocks = []
+    for t in tasks:
+        if t.is_fixed:
+            fixed_blocks.append({
+                "start": ai_service.time_to_minutes(t.start_time),
+                "end": ai_service.time_to_minutes(t.end_time),
+                "type": "fixed_task"
+            })
+    for b in request.breaks:
+        fixed_blocks.append({
+            "start": ai_service.parse_time_str(b.start_time),
+            "end": ai_service.parse_time_str(b.end_time),
+            "type": "user_break"
+        })
+    fixed_blocks.sort(key=lambda x: x["start"])
+
+    flexible_tasks = [t for t in tasks if not t.is_fixed]
+    prio_val = {"high": 3, "medium": 2, "low": 1}
+    flexible_tasks.sort(key=lambda x: (prio_val.get(x.priority.value, 1), x.duration), reverse=True)
+
+    current_time = day_start
+    proposals = []
+    fixed_blocks.append({"start": day_end, "end": day_end, "type": "end_of_day"})
+
+    for block in fixed_blocks:
+        if current_time >= day_end: break
+        effective_gap_end = min(block["start"], day_end)
+        if effective_gap_end > current_time:
+            gap_duration = effective_gap_end - current_time
+            i = 0
+            while i < len(flexible_tasks):
+                task = flexible_tasks[i]
+                if task.duration <= gap_duration:
+                    proposals.append({
+                        "task_id": task.id,
+                        "title": task.title,
+                        "old_start": task.start_time,
+                        "new_start": ai_service.minutes_to_time(current_time),
+                        "new_end": ai_service.minutes_to_time(current_time + task.duration)
+                    })
+                    current_time += task.duration
+                    gap_duration -= task.duration
+                    flexible_tasks.pop(i)
+                else:
+                    i += 1
+        current_time = max(current_time, block["end"])
+        current_time = max(current_time, day_start)
+
+    return proposals
+
+
+def measure_memory(Session, loader) -> dict:
+    """Pico de memoria (KiB) y bloques vivos tras una carga."""
+    db = Session()
+    tracemalloc.start()
+    loaded = loader(db, TARGET_DATE, user_id=1)
+    _, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    del loaded
+    db.close()
+    return {"peak_kib": round(peak / 1024, 1), "live_blocks": blocks}
+
+
+def _timed(Session, fn, repeat):
+    def setup():
+        return Session()
+
+    def call(db):
+        try:
+            fn(db)
+        finally:
+            db.close()
+
+    return time_calls(call, repeat, setup=setup)
+
+
+def run(scales=(10, 100, 1000), repeat: int = 20) -> dict:
+    results = {}
+    for n in scales:
+        Session = seed_database(n)
+        for name, loader in (("orm", orm_load), ("core", ai_service.load_day_tasks)):
+            stats = _timed(Session, lambda db: loader(db, TARGET_DATE, user_id=1), repeat)
+            results[f"optimizer.load_{name}[{n}]"] = result(
+                stats["p50_ms"], gate=name == "core", **stats, **measure_memory(Session, loader))
+        for name, solve in (("orm", orm_solve), ("core", ai_service.calculate_schedule)):
+            stats = _timed(Session, lambda db: solve(db, TARGET_DATE, REQUEST, user_id=1), repeat)
+            results[f"optimizer.solve_{name}[{n}]"] = result(stats["p50_ms"], gate=name == "core", **stats)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'benchmark':<28} {'p50 ms':>8} {'p99 ms':>8} {'pico KiB':>9} {'bloques vivos':>14}")
+    for name, r in run(args.tasks, args.repeat).items():
+        print(f"{name:<28} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} {r.get('peak_kib', ''):>9} {r.get('live_blocks', ''):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Utilidades de medición compartidas por los benchmarks.
+"""
+import math
+import time
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples_ms: list[float]) -> dict:
+    samples = sorted(samples_ms)
+    return {
+        "n": len(samples),
+        "mean_ms": sum(samples) / len(samples) if samples else 0.0,
+        "p50_ms": percentile(samples, 50),
+        "p99_ms": percentile(samples, 99),
+    }
+
+
+def time_calls(fn, repeat: int, setup=None, warmup: int = 1) -> dict:
+    """
+    Ejecuta fn() `repeat` veces y devuelve estadísticas en ms.
+    Si se pasa setup, se llama antes de cada ejecución y su resultado se pasa a fn.
+    """
+    for _ in range(warmup):
+        fn(setup()) if setup else fn()
+    samples = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        t0 = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples)
+
+
+def add_timing(results: dict, name: str, fn, repeat: int, setup=None):
+    """Mide fn y guarda el resultado (p50) en results; los fallos quedan registrados."""
+    try:
+        stats = time_calls(fn, repeat, setup=setup)
+    except Exception as exc:
+        results[name] = {"error": f"{type(exc).__name__}: {exc}"}
+        return None
+    results[name] = result(stats["p50_ms"], **stats)
+    return results[name]
+
+
+def result(value: float, unit: str = "ms", better: str = "lower", gate: bool = True, **extra) -> dict:
+    """
+    Entrada normalizada del fichero de resultados. gate=False marca las medidas
+    de referencia (código anterior o sin código del proyecto): se informan pero
+    no cuentan como regresión.
+    """
+    return {"value": round(value, 4), "unit": unit, "better": better, "gate": gate, **extra}
+
+
+def print_table(results: dict):
+    """Tabla legible de resultados (los errores se muestran en lugar de la medida)."""
+    print(f"{'benchmark':<32} {'valor':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        if "error" in r:
+            print(f"{name:<32} ERROR {r['error']}")
+            continue
+        p50 = f"{r['p50_ms']:.3f}" if "p50_ms" in r else ""
+        p99 = f"{r['p99_ms']:.3f}" if "p99_ms" in r else ""
+        print(f"{name:<32} {r['value']:>10.3f} {p50:>9} {p99:>9}  {r['unit']}")
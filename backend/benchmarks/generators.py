@@ -0,0 +1,104 @@
+"""
+Generadores de datos sintéticos para benchmarks (usuarios y tareas).
+Deterministas por semilla para que los resultados sean comparables.
+"""
+import os
+import random
+from functools import lru_cache
+from datetime import date, time as dtime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-no-usar-en-produccion")
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
+
+import models
+from database import Base
+
+# Escalas de tareas por usuario
+SCALES = (10, 100, 1000, 10000)
+
+TARGET_DATE = date(2026, 1, 15)
+
+# Contraseña de todos los usuarios sintéticos (para medir /auth/login)
+BENCH_PASSWORD = "contraseña-benchmark"
+
+
+def _sqlite_wal(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+    dbapi_connection.execute("PRAGMA synchronous=NORMAL")
+
+
+def make_engine(url: str = "sqlite://"):
+    """Engine SQLite (en memoria por defecto) con el esquema creado."""
+    if url == "sqlite://":
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        # Fichero: una conexión por sesión y WAL (lectores concurrentes con un escritor)
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=NullPool)
+        event.listen(engine, "connect", _sqlite_wal)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@lru_cache(maxsize=1)
+def bench_password_hash() -> str:
+    """Hash bcrypt real de BENCH_PASSWORD (se calcula una vez por proceso)."""
+    import auth
+    return auth.get_password_hash(BENCH_PASSWORD)
+
+
+def user_rows(n_users: int, start_id: int = 1) -> list[dict]:
+    hashed_password = bench_password_hash()
+    return [
+        {
+            "id": start_id + i,
+            "username": f"bench_{start_id + i}",
+            "email": f"bench_{start_id + i}@example.com",
+            "hashed_password": hashed_password,
+            "is_active": True,
+        }
+        for i in range(n_users)
+    ]
+
+
+def task_rows(user_id: int, n_tasks: int, target_date: date = TARGET_DATE, days: int = 1,
+              seed: int = 42) -> list[dict]:
+    """n_tasks tareas repartidas en `days` días a partir de target_date (~20% fijas)."""
+    rnd = random.Random(seed * 100_003 + user_id)
+    priorities = list(models.Priority)
+    rows = []
+    for i in range(n_tasks):
+        start = rnd.randrange(8 * 60, 21 * 60, 15)
+        duration = rnd.choice((15, 30, 45, 60, 90))
+        end = min(start + duration, 23 * 60 + 59)
+        rows.append({
+            "user_id": user_id,
+            "title": f"Tarea {i}",
+            "description": "Descripción larga de relleno " * 5,
+            "type": models.TaskType.study,
+            "priority": rnd.choice(priorities),
+            "date": target_date + timedelta(days=i % days),
+            "start_time": dtime(start // 60, start % 60),
+            "end_time": dtime(end // 60, end % 60),
+            "duration": duration,
+            "is_fixed": rnd.random() < 0.2,
+            "email_reminder": False,
+            "repeat_weekly": False,
+            "completed": False,
+        })
+    return rows
+
+
+def seed_database(n_tasks: int, n_users: int = 1, days: int = 1, seed: int = 42, url: str = "sqlite://"):
+    """Crea una BD con n_users usuarios y n_tasks tareas cada uno. Devuelve un sessionmaker."""
+    engine = make_engine(url)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User.__table__), user_rows(n_users))
+        for user_id in range(1, n_users + 1):
+            rows = task_rows(user_id, n_tasks, days=days, seed=seed)
+            if rows:
+                conn.execute(insert(models.Task.__table__), rows)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
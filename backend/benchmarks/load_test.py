@@ -0,0 +1,147 @@
+"""
+Prueba de carga en proceso (ASGI, sin red) de los endpoints principales.
+Informa de throughput, p50/p99 y códigos de respuesta por endpoint.
+
+Uso (desde backend/):
+    python -m benchmarks.load_test --tasks 100 --requests 500 --concurrency 20
+    ADMISSION_ENABLED=1 python -m benchmarks.load_test   # con control de admisión
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-no-usar-en-produccion")
+# Sin control de admisión salvo que se pida: mide la API, no el rechazo rápido
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import httpx
+
+from benchmarks.generators import BENCH_PASSWORD, TARGET_DATE, seed_database
+from benchmarks.common import summarize, result, print_table
+
+NEW_TASK = {
+    "title": "Tarea carga",
+    "description": "Creada por load_test",
+    "type": "study",
+    "priority": "medium",
+    "date": str(TARGET_DATE),
+    "start_time": "09:00:00",
+    "end_time": "10:00:00",
+    "duration": 60,
+}
+OPTIMIZE = {
+    "day_start": "08:00",
+    "day_end": "22:00",
+    "breaks": [{"start_time": "14:00", "end_time": "15:00"}],
+}
+
+LOGIN = {"username": "bench_1", "password": BENCH_PASSWORD}
+
+ENDPOINTS = {
+    "health": ("GET", "/health", None),
+    "login": ("POST", "/auth/login", LOGIN),
+    "get_tasks": ("GET", "/tasks", None),
+    "create_task": ("POST", "/tasks", NEW_TASK),
+    "optimize": ("POST", f"/optimize/calculate/{TARGET_DATE}", OPTIMIZE),
+}
+
+# bcrypt es deliberadamente lento (~0.2 s por login): menos peticiones
+MAX_REQUESTS = {"login": 30}
+
+
+def build_app(n_tasks: int, url: str):
+    """App real con BD sintética, sin rate limiting (mediría el limitador, no la API)."""
+    import main
+    from database import get_db
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # SQLite en fichero: cada hilo del threadpool usa su propia conexión
+    Session = seed_database(n_tasks, url=url)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # Lecturas (GET /tasks, /optimize/calculate) y escrituras contra la misma BD sintética
+    main.app.dependency_overrides[get_db] = override_get_db
+    main.app.dependency_overrides[main.get_read_db] = override_get_db
+    main.limiter.enabled = False
+    return main.app
+
+
+async def _login(client) -> dict:
+    """Token real obtenido por /auth/login para el usuario sintético."""
+    response = await client.post("/auth/login", json=LOGIN)
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def _hammer(client, method, path, body, headers, total, concurrency):
+    latencies = []
+    statuses = Counter()
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            t0 = time.perf_counter()
+            response = await client.request(method, path, json=body, headers=headers)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+async def _run(n_tasks: int, total: int, concurrency: int, endpoints) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(n_tasks, f"sqlite:///{tmp}/load_test.db")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+            headers = await _login(client)
+            for name in endpoints:
+                method, path, body = ENDPOINTS[name]
+                n = min(total, MAX_REQUESTS.get(name, total))
+                await _hammer(client, method, path, body, headers, min(n, 20), concurrency)  # warmup
+                latencies, statuses, elapsed = await _hammer(client, method, path, body, headers, n, concurrency)
+                stats = summarize(latencies)
+                codes = {str(code): count for code, count in sorted(statuses.items())}
+                key = f"load.{name}[{n_tasks}]"
+                results[f"{key}.throughput"] = result(n / elapsed, unit="req/s", better="higher", status=codes)
+                results[f"{key}.p99"] = result(stats["p99_ms"], **stats, status=codes)
+    return results
+
+
+def run(scales=(100,), total: int = 500, concurrency: int = 20, endpoints=tuple(ENDPOINTS)) -> dict:
+    results = {}
+    for n in scales:
+        results.update(asyncio.run(_run(n, total, concurrency, endpoints)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[100])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    args = parser.parse_args()
+
+    results = run(args.tasks, args.requests, args.concurrency, args.endpoints)
+    print_table(results)
+    for name, r in results.items():
+        if name.endswith(".throughput") and set(r["status"]) - {"200"}:
+            print(f"⚠️  {name}: respuestas no-200 {r['status']}")
+
+
+if __name__ == "__main__":
+    main()
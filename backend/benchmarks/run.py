@@ -0,0 +1,138 @@
+"""
+Ejecuta la suite de benchmarks, guarda los resultados en JSON y los compara
+con la línea base almacenada (benchmarks/baseline.json).
+
+Uso (desde backend/):
+    python -m benchmarks.run                       # escalas rápidas + comparación
+    python -m benchmarks.run --full                # incluye 10k tareas por usuario
+    python -m benchmarks.run --update-baseline     # reescribe la línea base
+
+La suite se ejecuta --runs veces y cada medida guarda la mediana de sus
+ejecuciones (también la línea base). Sale con código 1 si alguna medida
+empeora más que --tolerance en la mediana y en todas las ejecuciones: una
+ejecución ruidosa no basta para marcar una regresión. Las medidas de
+referencia (gate=False) no cuentan.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.generators import SCALES
+from benchmarks.common import print_table
+from benchmarks import bench_optimizer, bench_crud, bench_auth, bench_middleware, load_test
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+RESULTS_PATH = BENCH_DIR / "results" / "latest.json"
+
+QUICK_SCALES = SCALES[:3]
+
+
+def run_suite(scales, repeat: int, load_requests: int, concurrency: int) -> dict:
+    results = {}
+    results.update(bench_optimizer.run(scales, repeat))
+    results.update(bench_crud.run(scales, repeat))
+    results.update(bench_auth.run(repeat * 10))
+    results.update(bench_middleware.run(repeat * 100))
+    results.update(load_test.run(scales[1:2] or scales[:1], load_requests, concurrency))
+    return results
+
+
+def merge_runs(runs: list[dict]) -> dict:
+    """
+    Combina varias ejecuciones de la suite: cada medida toma la entrada de la
+    ejecución mediana (mediana baja, así p50/p99 son de una ejecución real) y
+    guarda en "runs" los valores de todas. Un fallo en cualquiera se conserva.
+    """
+    merged = {}
+    for name in runs[0]:
+        entries = [run[name] for run in runs if name in run]
+        failed = [entry for entry in entries if "error" in entry]
+        if failed:
+            merged[name] = failed[0]
+            continue
+        median = statistics.median_low(entry["value"] for entry in entries)
+        chosen = next(entry for entry in entries if entry["value"] == median)
+        merged[name] = {**chosen, "runs": [entry["value"] for entry in entries]}
+    return merged
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Lista de regresiones respecto a la línea base (sin las medidas de referencia)."""
+    regressions = []
+    for name, base in baseline.items():
+        if "value" not in base or name not in current:
+            continue
+        cur = current[name]
+        if not (base.get("gate", True) and cur.get("gate", True)):
+            continue
+        if "error" in cur:
+            regressions.append(f"{name}: ahora falla ({cur['error']})")
+            continue
+        runs = cur.get("runs", [cur["value"]])
+        if base["better"] == "lower" and min(runs + [cur["value"]]) > base["value"] * (1 + tolerance):
+            regressions.append(f"{name}: {cur['value']:.3f} {cur['unit']} > {base['value']:.3f} (+{cur['value'] / base['value'] - 1:.0%})")
+        elif base["better"] == "higher" and max(runs + [cur["value"]]) < base["value"] / (1 + tolerance):
+            regressions.append(f"{name}: {cur['value']:.3f} {cur['unit']} < {base['value']:.3f} ({cur['value'] / base['value'] - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="Incluye todas las escalas (hasta 10k tareas)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=3, help="Ejecuciones de la suite (se compara la mediana)")
+    parser.add_argument("--load-requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Empeoramiento permitido (0.25 = 25%%)")
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    scales = SCALES if args.full else QUICK_SCALES
+    results = merge_runs([run_suite(scales, args.repeat, args.load_requests, args.concurrency)
+                          for _ in range(max(1, args.runs))])
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scales": list(scales),
+            "repeat": args.repeat,
+            "runs": max(1, args.runs),
+        },
+        "results": results,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print_table(results)
+    print(f"\nResultados guardados en {args.output}")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Línea base actualizada: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print("Sin línea base: ejecuta con --update-baseline para crearla")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regresiones (tolerancia {args.tolerance:.0%}):")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"\n✅ Sin regresiones frente a la línea base (tolerancia {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
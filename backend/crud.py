@@ -1,25 +1,33 @@
+from typing import Optional
 from sqlalchemy.orm import Session
 import models, schemas
 
+def _task_query(db: Session, user_id: Optional[int] = None):
+    # Si se indica user_id, solo se ven las tareas de ese usuario
+    query = db.query(models.Task)
+    if user_id is not None:
+        query = query.filter(models.Task.user_id == user_id)
+    return query
+
 # --- LEER ---
-def get_tasks(db: Session):
-    return db.query(models.Task).all()
+def get_tasks(db: Session, user_id: Optional[int] = None):
+    return _task_query(db, user_id).all()
 
-def get_task(db: Session, task_id: int):
-    return db.query(models.Task).filter(models.Task.id == task_id).first()
+def get_task(db: Session, task_id: int, user_id: Optional[int] = None):
+    return _task_query(db, user_id).filter(models.Task.id == task_id).first()
 
 # --- CREAR ---
-def create_task(db: Session, task: schemas.TaskCreate):
+def create_task(db: Session, task: schemas.TaskCreate, user_id: int):
     # Usar model_dump() en lugar de dict()
-    db_task = models.Task(**task.model_dump()) 
+    db_task = models.Task(**task.model_dump(), user_id=user_id)
     db.add(db_task)
     db.commit()
     db.refresh(db_task)
     return db_task
 
 # --- BORRAR ---
-def delete_task(db: Session, task_id: int):
-    db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
+def delete_task(db: Session, task_id: int, user_id: Optional[int] = None):
+    db_task = get_task(db, task_id, user_id)
     if db_task:
         db.delete(db_task)
         db.commit()
@@ -27,8 +35,8 @@ def delete_task(db: Session, task_id: int):
     return False
 
 # --- ACTUALIZAR ---
-def update_task(db: Session, task_id: int, task_update: schemas.TaskCreate):
-    db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
+def update_task(db: Session, task_id: int, task_update: schemas.TaskCreate, user_id: Optional[int] = None):
+    db_task = get_task(db, task_id, user_id)
     if not db_task:
         return None
     
@@ -0,0 +1,390 @@
+"""
+OpoCalendar Idempotency Module
+Soporte de la cabecera Idempotency-Key en las rutas que modifican datos.
+
+La primera petición con una clave se ejecuta y su respuesta se guarda; los
+reintentos con la misma clave (mismo usuario, método y ruta) reciben la
+respuesta guardada sin volver a ejecutar el endpoint. Si llega un duplicado
+mientras la primera sigue en curso, espera a que termine.
+
+Almacén: memoria (LRU acotado con TTL). Con IDEMPOTENCY_SQLITE_PATH se añade
+una base SQLite compartida entre workers, con las respuestas completadas y
+las ejecuciones en curso. Así un duplicado que llegue a otro worker también
+espera en vez de ejecutarse dos veces. El claim de una ejecución en curso
+caduca a los IDEMPOTENCY_CLAIM_SECONDS y se renueva mientras la petición
+sigue viva: solo queda huérfano si el worker muere.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from anyio import to_thread
+
+import metrics
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+
+TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+CLAIM_SECONDS = float(os.getenv("IDEMPOTENCY_CLAIM_SECONDS", "10"))
+SQLITE_PATH = os.getenv("IDEMPOTENCY_SQLITE_PATH")
+PURGE_INTERVAL_SECONDS = 60.0
+
+# Rutas cubiertas (prefijos) y métodos que modifican datos
+IDEMPOTENT_PREFIXES = ("/tasks", "/optimize/apply")
+MUTATING_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+# Respuestas que no se guardan: el cliente debe poder reintentar de verdad
+_NOT_CACHEABLE = frozenset({408, 409, 425, 429})
+
+IDEMPOTENCY_REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    "idempotency_requests_total", "Peticiones con Idempotency-Key por resultado", ("outcome",)))
+IDEMPOTENCY_STORE_ERRORS = metrics.REGISTRY.register(metrics.Counter(
+    "idempotency_store_errors_total", "Fallos del almacén de idempotencia por operación", ("operation",)))
+
+logger = logging.getLogger("idempotency")
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status", "headers", "body", "expires_at")
+
+    def __init__(self, fingerprint: str, status: int, headers: list, body: bytes, expires_at: float):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+
+class MemoryStore:
+    """LRU acotado con expiración por TTL (un solo proceso)."""
+
+    claim_seconds = CLAIM_SECONDS
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_local(self, key: str) -> Optional[StoredResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put_local(self, key: str, entry: StoredResponse):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        return self._get_local(key)
+
+    async def put(self, key: str, entry: StoredResponse):
+        self._put_local(key, entry)
+
+    # Las ejecuciones en curso de un solo proceso ya las coordina el middleware
+    async def claim(self, key: str) -> bool:
+        return True
+
+    async def is_claimed(self, key: str) -> bool:
+        return False
+
+    async def extend(self, key: str):
+        pass
+
+    async def release(self, key: str):
+        pass
+
+
+class SQLiteStore(MemoryStore):
+    """
+    Caché en memoria delante de una tabla SQLite compartida entre workers: las
+    respuestas completadas y las ejecuciones en curso (claims). Las consultas
+    se hacen en el threadpool para no bloquear el event loop.
+    """
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS,
+                 claim_seconds: float = CLAIM_SECONDS):
+        super().__init__(max_entries, ttl)
+        self.claim_seconds = claim_seconds
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS idempotency_responses ("
+            " key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, status INTEGER NOT NULL,"
+            " headers TEXT NOT NULL, body BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_idempotency_expires ON idempotency_responses (expires_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS idempotency_claims (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self._db_lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def _db_get(self, key: str) -> Optional[StoredResponse]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, status, headers, body, expires_at FROM idempotency_responses"
+                " WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in json.loads(row[2])]
+        entry = StoredResponse(row[0], row[1], headers, row[3], row[4])
+        self._put_local(key, entry)
+        return entry
+
+    def _db_put(self, key: str, entry: StoredResponse):
+        headers = json.dumps([(k.decode("latin-1"), v.decode("latin-1")) for k, v in entry.headers])
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO idempotency_responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, entry.fingerprint, entry.status, headers, entry.body, entry.expires_at),
+            )
+            # Limpieza de caducadas como mucho una vez por PURGE_INTERVAL_SECONDS
+            if now >= self._next_purge:
+                self._next_purge = now + PURGE_INTERVAL_SECONDS
+                self._conn.execute("DELETE FROM idempotency_responses WHERE expires_at <= ?", (now,))
+                self._conn.execute("DELETE FROM idempotency_claims WHERE expires_at <= ?", (now,))
+
+    def _db_claim(self, key: str) -> bool:
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute("DELETE FROM idempotency_claims WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO idempotency_claims VALUES (?, ?)", (key, now + self.claim_seconds))
+            return cursor.rowcount == 1
+
+    def _db_is_claimed(self, key: str) -> bool:
+        with self._db_lock:
+            return self._conn.execute(
+                "SELECT 1 FROM idempotency_claims WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone() is not None
+
+    def _db_extend(self, key: str):
+        # UPDATE y no INSERT: un claim ya liberado no se resucita
+        with self._db_lock:
+            self._conn.execute("UPDATE idempotency_claims SET expires_at = ? WHERE key = ?",
+                               (time.time() + self.claim_seconds, key))
+
+    def _db_release(self, key: str):
+        with self._db_lock:
+            self._conn.execute("DELETE FROM idempotency_claims WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        entry = self._get_local(key)
+        if entry is not None:
+            return entry
+        return await to_thread.run_sync(self._db_get, key)
+
+    async def put(self, key: str, entry: StoredResponse):
+        self._put_local(key, entry)
+        await to_thread.run_sync(self._db_put, key, entry)
+
+    async def claim(self, key: str) -> bool:
+        return await to_thread.run_sync(self._db_claim, key)
+
+    async def is_claimed(self, key: str) -> bool:
+        return await to_thread.run_sync(self._db_is_claimed, key)
+
+    async def extend(self, key: str):
+        await to_thread.run_sync(self._db_extend, key)
+
+    async def release(self, key: str):
+        await to_thread.run_sync(self._db_release, key)
+
+
+def build_store():
+    return SQLiteStore(SQLITE_PATH) if SQLITE_PATH else MemoryStore()
+
+
+def _json_response(status: int, detail: str) -> tuple:
+    body = json.dumps({"detail": detail}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    return status, headers, body
+
+
+class IdempotencyMiddleware:
+    """
+    Middleware ASGI puro. `identify` recibe la cabecera Authorization y devuelve
+    el id del usuario (o None): las claves se aíslan por usuario, no por token,
+    para que un reintento tras refrescar el token siga coincidiendo.
+    """
+
+    def __init__(self, app, identify: Callable[[str], Optional[str]], store=None):
+        self.app = app
+        self.identify = identify
+        self.store = store or build_store()
+        self._in_flight = {}
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] not in MUTATING_METHODS
+                or not scope["path"].startswith(IDEMPOTENT_PREFIXES)):
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = authorization = None
+        for name, value in scope["headers"]:
+            if name == IDEMPOTENCY_HEADER:
+                idempotency_key = value.decode("latin-1")
+            elif name == b"authorization":
+                authorization = value.decode("latin-1")
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await self._send(send, *_json_response(400, "Idempotency-Key inválida"))
+            return
+        user_id = self.identify(authorization) if authorization else None
+        if user_id is None:
+            # Sin usuario válido el endpoint responderá 401: no hay nada que cachear
+            await self.app(scope, receive, send)
+            return
+
+        # Leer el cuerpo completo para calcular la huella de la petición
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        key = f"{user_id}:{scope['method']}:{scope['path']}:{idempotency_key}"
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WAIT_SECONDS
+        while True:
+            stored = await self.store.get(key)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    IDEMPOTENCY_REQUESTS.inc("mismatch")
+                    await self._send(send, *_json_response(422, "Idempotency-Key reutilizada con otra petición"))
+                    return
+                IDEMPOTENCY_REQUESTS.inc("replayed")
+                await self._send(send, stored.status, stored.headers + [(b"idempotent-replayed", b"true")], stored.body)
+                return
+
+            pending = self._in_flight.get(key)
+            if pending is not None:
+                # Duplicado concurrente en este worker: esperar a la primera ejecución
+                try:
+                    await asyncio.wait_for(asyncio.shield(pending), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                continue
+
+            done = loop.create_future()
+            self._in_flight[key] = done
+            try:
+                claimed = await self.store.claim(key)
+            except BaseException:
+                del self._in_flight[key]
+                done.set_result(None)
+                raise
+            if claimed:
+                IDEMPOTENCY_REQUESTS.inc("executed")
+                heartbeat = asyncio.ensure_future(self._keep_claim(key))
+                try:
+                    await self._execute(scope, body, receive, send, key, fingerprint)
+                finally:
+                    heartbeat.cancel()
+                    try:
+                        await self.store.release(key)
+                    except Exception:
+                        # El claim caduca solo a los claim_seconds
+                        IDEMPOTENCY_STORE_ERRORS.inc("release")
+                        logger.exception("No se pudo liberar el claim de idempotencia %s", key)
+                    finally:
+                        del self._in_flight[key]
+                        done.set_result(None)
+                return
+
+            # Otro worker la está ejecutando: sondear hasta que guarde la respuesta o suelte el claim
+            del self._in_flight[key]
+            done.set_result(None)
+            if not await self._wait_for_other_worker(key, deadline):
+                break
+
+        IDEMPOTENCY_REQUESTS.inc("conflict")
+        await self._send(send, *_json_response(409, "Petición con la misma Idempotency-Key en curso"))
+
+    async def _keep_claim(self, key: str):
+        """Renueva el claim mientras se ejecuta la petición, por larga que sea."""
+        while True:
+            await asyncio.sleep(self.store.claim_seconds / 3)
+            try:
+                await self.store.extend(key)
+            except Exception:
+                IDEMPOTENCY_STORE_ERRORS.inc("extend")
+                logger.exception("No se pudo renovar el claim de idempotencia %s", key)
+
+    async def _wait_for_other_worker(self, key: str, deadline: float) -> bool:
+        loop = asyncio.get_running_loop()
+        delay = 0.05
+        while loop.time() < deadline:
+            await asyncio.sleep(min(delay, max(0.0, deadline - loop.time())))
+            if await self.store.get(key) is not None or not await self.store.is_claimed(key):
+                return True
+            delay = min(delay * 2, 0.5)
+        return False
+
+    async def _execute(self, scope, body: bytes, receive, send, key: str, fingerprint: str):
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()  # Tras el cuerpo solo queda esperar la desconexión
+
+        status = None
+        headers = []
+        response_chunks = []
+
+        async def capture_send(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", ()))
+            elif message["type"] == "http.response.body":
+                response_chunks.append(message.get("body", b""))
+                if not message.get("more_body", False) and status < 500 and status not in _NOT_CACHEABLE:
+                    # Se guarda antes de enviar el final: un reintento inmediato ya la encuentra.
+                    # Si el almacén falla, la respuesta se envía igualmente (sin guardar)
+                    try:
+                        await self.store.put(key, StoredResponse(
+                            fingerprint, status, headers, b"".join(response_chunks), time.time() + self.store.ttl))
+                    except Exception:
+                        IDEMPOTENCY_STORE_ERRORS.inc("put")
+                        logger.exception("No se pudo guardar la respuesta idempotente %s", key)
+            await send(message)
+
+        await self.app(scope, replay_receive, capture_send)
+
+    @staticmethod
+    async def _send(send, status: int, headers: list, body: bytes):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -1,19 +1,29 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+import math
+import time
+_BOOT_STARTED = time.perf_counter()  # Medición del tiempo de arranque
+
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Header
+from fastapi.responses import Response, FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.middleware.gzip import GZIPMiddleware
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from typing import List
+from typing import List, Optional
 import os
 from datetime import timedelta
 import logging
+import hmac
+from contextlib import asynccontextmanager
+from sqlalchemy.exc import SQLAlchemyError
 
-import models, schemas, crud, ai_service
-from database import engine, get_db
+import models, schemas, crud, metrics, profiling, database, admission, idempotency
+import ai_service
+from middleware import CompressionMiddleware, SecurityHeadersMiddleware
+from database import engine, read_engine, get_db
 from auth import get_current_user, create_access_token, create_refresh_token, validate_input
+from auth import user_id_from_authorization
 from auth import get_password_hash, verify_password, ACCESS_TOKEN_EXPIRE_MINUTES
 from datetime import date
 
@@ -21,22 +31,69 @@ from datetime import date
 logging.basicConfig(level=logging.INFO)
 audit_logger = logging.getLogger("audit")
 
-# Crear tablas al inicio
-models.Base.metadata.create_all(bind=engine)
+# El esquema se gestiona con migraciones (alembic upgrade head), no al importar
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_seconds = time.perf_counter() - _BOOT_STARTED
+    metrics.APP_STARTUP_SECONDS.set(startup_seconds)
+    logging.getLogger("startup").info(f"API lista en {startup_seconds:.3f}s")
+    yield
 
 app = FastAPI(
     title="OpoCalendar API - Secured",
     description="Study planner with AI optimization - Production Ready",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
+def get_read_db(x_last_write: Optional[str] = Header(None)):
+    """Sesión de solo lectura (réplica si existe; primaria si X-Last-Write es reciente)"""
+    db = database.open_read_session(x_last_write)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def mark_write(response: Response):
+    """Devuelve X-Last-Write: el cliente la reenvía y sus lecturas van a la primaria"""
+    marker = database.write_marker()
+    if marker:
+        response.headers[database.LAST_WRITE_HEADER] = marker
+
 # ✅ RATE LIMITING
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 
 @app.exception_handler(RateLimitExceeded)
-async def rate_limit_handler(request, exc):
-    return HTTPException(status_code=429, detail="Demasiadas solicitudes. Intenta más tarde.")
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    metrics.RATE_LIMIT_REJECTIONS.inc(metrics.route_label(request.scope))
+    # Segundos hasta que se reinicia la ventana (o la ventana completa si no se conoce)
+    retry_after = exc.limit.limit.get_expiry()
+    view_rate_limit = getattr(request.state, "view_rate_limit", None)
+    if view_rate_limit is not None:
+        reset_at, _ = limiter.limiter.get_window_stats(view_rate_limit[0], *view_rate_limit[1])
+        retry_after = max(1, math.ceil(reset_at - time.time()))
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Demasiadas solicitudes. Intenta más tarde."},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+# 🔬 PERFILADO BAJO DEMANDA (solo si PROFILING_ENABLED; coste cero si no)
+if profiling.ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+    profiling.install_sql_hook(engine)
+    if read_engine is not engine:
+        profiling.install_sql_hook(read_engine)
+
+# 🚦 CONTROL DE ADMISIÓN (concurrencia y cola por clase de ruta; 503 al saturarse)
+# Dentro de CORS para que el 503 + Retry-After llegue legible al navegador
+if admission.ENABLED:
+    app.add_middleware(admission.AdmissionMiddleware)
+
+# 🔁 IDEMPOTENCY-KEY (reintentos de POST /tasks, /optimize/apply... sin duplicar)
+app.add_middleware(idempotency.IdempotencyMiddleware, identify=user_id_from_authorization)
 
 # ✅ CORS RESTRICTIVO (Solo localhost en dev, producción específica en prod)
 allowed_origins = [
@@ -55,9 +112,9 @@ app.add_middleware(
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # ✅ Métodos específicos
-    allow_headers=["Content-Type", "Authorization", "X-CSRF-Token"],  # ✅ Headers específicos
+    allow_headers=["Content-Type", "Authorization", "X-CSRF-Token", "Idempotency-Key", "X-Last-Write"],  # ✅ Headers específicos
     max_age=3600,  # Cache CORS 1 hora
-    expose_headers=["X-Total-Count"],  # Headers expuestos al cliente
+    expose_headers=["X-Total-Count", "Idempotent-Replayed", "Retry-After", "X-Last-Write"],  # Headers expuestos al cliente
 )
 
 # ✅ TRUSTED HOSTS (Previene ataques de redirección)
@@ -66,20 +123,14 @@ app.add_middleware(
     allowed_hosts=["localhost", "127.0.0.1", os.getenv("FRONTEND_HOST", "localhost")]
 )
 
-# ✅ GZIP COMPRESSION (Reduce tamaño de respuestas)
-app.add_middleware(GZIPMiddleware, minimum_size=1000)
-
-# ✅ SECURITY HEADERS (Middleware personalizado)
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["X-Content-Type-Options"] = "nosniff"  # Previene MIME type sniffing
-    response.headers["X-Frame-Options"] = "DENY"  # Respuesta no puede ser framed
-    response.headers["X-XSS-Protection"] = "1; mode=block"  # Protección XSS histórica
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"  # HSTS
-    response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline'"  # CSP
-    response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-    return response
+# ✅ COMPRESIÓN zstd/gzip (ASGI puro, compatible con streaming)
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
+
+# 📊 MÉTRICAS (latencia, códigos y consultas SQL por ruta)
+app.add_middleware(metrics.MetricsMiddleware, routes=app.router.routes)
+
+# ✅ SECURITY HEADERS (ASGI puro, cabeceras precalculadas; ver middleware.py)
+app.add_middleware(SecurityHeadersMiddleware)
 
 @app.get("/")
 def read_root():
@@ -92,9 +143,11 @@ def read_root():
 
 # ============== ENDPOINTS DE AUTENTICACIÓN ==============
 
+# register, login y calculate_optimization son síncronos a propósito: bcrypt y el
+# solver se ejecutan en el threadpool y no bloquean el event loop (ni las lecturas)
 @app.post("/auth/register", response_model=schemas.TokenResponse)
 @limiter.limit("5/minute")  # Máximo 5 registros por minuto
-async def register(request, user_data: schemas.UserRegister, db: Session = Depends(get_db)):
+def register(request: Request, user_data: schemas.UserRegister, db: Session = Depends(get_db)):
     """Registrar un nuevo usuario"""
     try:
         # Validar inputs
@@ -125,10 +178,10 @@ async def register(request, user_data: schemas.UserRegister, db: Session = Depen
         
         # Generar tokens
         access_token = create_access_token(
-            data={"sub": new_user.id, "username": new_user.username},
+            data={"sub": str(new_user.id), "username": new_user.username},
             expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         )
-        refresh_token = create_refresh_token(data={"sub": new_user.id})
+        refresh_token = create_refresh_token(data={"sub": str(new_user.id)})
         
         return {
             "access_token": access_token,
@@ -140,7 +193,7 @@ async def register(request, user_data: schemas.UserRegister, db: Session = Depen
 
 @app.post("/auth/login", response_model=schemas.TokenResponse)
 @limiter.limit("10/minute")  # Máximo 10 intentos por minuto
-async def login(request, credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+def login(request: Request, credentials: schemas.UserLogin, db: Session = Depends(get_db)):
     """Autenticar usuario"""
     user = db.query(models.User).filter(models.User.username == credentials.username).first()
     
@@ -153,10 +206,10 @@ async def login(request, credentials: schemas.UserLogin, db: Session = Depends(g
     
     # Generar tokens
     access_token = create_access_token(
-        data={"sub": user.id, "username": user.username},
+        data={"sub": str(user.id), "username": user.username},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
-    refresh_token = create_refresh_token(data={"sub": user.id})
+    refresh_token = create_refresh_token(data={"sub": str(user.id)})
     
     return {
         "access_token": access_token,
@@ -168,7 +221,7 @@ async def login(request, credentials: schemas.UserLogin, db: Session = Depends(g
 async def refresh_token(current_user: dict = Depends(get_current_user)):
     """Refrescar token de acceso"""
     access_token = create_access_token(
-        data={"sub": current_user["user_id"], "username": current_user["username"]},
+        data={"sub": str(current_user["user_id"]), "username": current_user["username"]},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     return {
@@ -178,7 +231,7 @@ async def refresh_token(current_user: dict = Depends(get_current_user)):
 
 @app.post("/auth/logout")
 @limiter.limit("10/minute")
-async def logout(request, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def logout(request: Request, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     """Logout del usuario - invalida sesión"""
     audit_logger.info(f"Usuario {current_user['user_id']} ha cerrado sesión")
     # En producción, guardarías el token en una blacklist
@@ -190,55 +243,110 @@ async def logout(request, current_user: dict = Depends(get_current_user), db: Se
 # 1. Obtener tareas del usuario autenticado
 @app.get("/tasks", response_model=List[schemas.Task])
 @limiter.limit("30/minute")
-async def read_tasks(request, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def read_tasks(request: Request, current_user: dict = Depends(get_current_user), db: Session = Depends(get_read_db)):
     return crud.get_tasks(db, user_id=current_user["user_id"])
 
 # 2. Crear una tarea
 @app.post("/tasks", response_model=schemas.Task)
 @limiter.limit("20/minute")
-async def create_task(request, task: schemas.TaskCreate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    return crud.create_task(db=db, task=task, user_id=current_user["user_id"])
+async def create_task(request: Request, response: Response, task: schemas.TaskCreate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    db_task = crud.create_task(db=db, task=task, user_id=current_user["user_id"])
+    mark_write(response)
+    return db_task
 
 # 3. Borrar una tarea
 @app.delete("/tasks/{task_id}")
 @limiter.limit("20/minute")
-async def delete_task(request, task_id: int, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_task(request: Request, response: Response, task_id: int, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     success = crud.delete_task(db, task_id, user_id=current_user["user_id"])
     if not success:
         raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    mark_write(response)
     return {"message": "Tarea eliminada"}
 
 # 4. Actualizar una tarea
 @app.put("/tasks/{task_id}", response_model=schemas.Task)
 @limiter.limit("20/minute")
-async def update_task(request, task_id: int, task: schemas.TaskUpdate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_task(request: Request, response: Response, task_id: int, task: schemas.TaskUpdate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     updated_task = crud.update_task(db, task_id, task, user_id=current_user["user_id"])
     if updated_task is None:
         raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    mark_write(response)
     audit_logger.info(f"Usuario {current_user['user_id']} actualizó tarea {task_id}")
     return updated_task
 
 # ============== HEALTH CHECK ==============
+# Liveness: el proceso responde (sin tocar la BD). /health se mantiene por compatibilidad
 @app.get("/health")
+@app.get("/health/live")
 async def health_check():
-    """Verificar estado de la API"""
+    """Verificar que la API está viva"""
     return {"status": "healthy", "version": "2.0.0"}
 
+# Readiness: BD accesible y migraciones aplicadas
+_schema_ready = False
+
+@app.get("/health/ready")
+def readiness_check():
+    """Verificar que la API puede atender tráfico"""
+    global _schema_ready
+    try:
+        database.ping()
+        if not _schema_ready:
+            _schema_ready = database.schema_is_current()
+    except SQLAlchemyError:
+        return JSONResponse(status_code=503, content={"status": "not_ready", "reason": "Base de datos no disponible"})
+    if not _schema_ready:
+        return JSONResponse(status_code=503, content={"status": "not_ready", "reason": "Migraciones pendientes"})
+    return {"status": "ready", "version": "2.0.0"}
+
+# ============== MÉTRICAS (USO INTERNO) ==============
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics(request: Request):
+    """Métricas en formato de texto de Prometheus (token o solo desde localhost)"""
+    if METRICS_TOKEN:
+        allowed = hmac.compare_digest(request.headers.get("X-Metrics-Token", ""), METRICS_TOKEN)
+    else:
+        allowed = request.client is not None and request.client.host in ("127.0.0.1", "::1")
+    if not allowed:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+# ============== PERFILES (SOLO ADMIN) ==============
+def require_profiling_admin(request: Request):
+    if not profiling.is_admin(request.headers.get("X-Profile-Token")):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/admin/profiles", include_in_schema=False, dependencies=[Depends(require_profiling_admin)])
+async def list_profiles():
+    """Listar los perfiles capturados"""
+    return profiling.list_profiles()
+
+@app.get("/admin/profiles/{name}", include_in_schema=False, dependencies=[Depends(require_profiling_admin)])
+async def download_profile(name: str):
+    """Descargar un perfil (.prof para pstats/snakeviz, .json con tiempos SQL)"""
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return FileResponse(path, filename=name)
+
 # Endpoints de IA - con autenticación
 @app.post("/optimize/calculate/{target_date}", response_model=List[schemas.TaskProposal])
 @limiter.limit("10/minute")
-async def calculate_optimization(
-    request,
+def calculate_optimization(  # Síncrono: el solver (CPU) corre en el threadpool
+    request: Request,
     target_date: date,
     req: schemas.OptimizationRequest,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)  # Fase de lectura: no escribe nada
 ):
     return ai_service.calculate_schedule(db, target_date, req, user_id=current_user["user_id"])
 
 @app.post("/optimize/apply")
 @limiter.limit("10/minute")
-async def apply_optimization(request, proposals: List[schemas.TaskProposal], current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def apply_optimization(request: Request, response: Response, proposals: List[schemas.TaskProposal], current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     count = 0
     for p in proposals:
         db_task = crud.get_task(db, p.task_id, user_id=current_user["user_id"])
@@ -247,6 +355,7 @@ async def apply_optimization(request, proposals: List[schemas.TaskProposal], cur
             db_task.end_time = p.new_end
             count += 1
     db.commit()
+    mark_write(response)
     return {"message": f"{count} tareas actualizadas correctamente"}
 
 # 4. Actualizar una tarea (Editar / Completar)
@@ -277,4 +386,6 @@ def apply_optimization(proposals: List[schemas.TaskProposal], db: Session = Depe
             db_task.end_time = p.new_end
             count += 1
     db.commit()
-    return {"message": f"{count} tareas actualizadas correctamente"}
\ No newline at end of file
+    return {"message": f"{count} tareas actualizadas correctamente"}
+
+metrics.APP_IMPORT_SECONDS.set(time.perf_counter() - _BOOT_STARTED)
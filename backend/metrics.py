@@ -0,0 +1,244 @@
+"""
+OpoCalendar Metrics Module
+Métricas en memoria con exposición en formato de texto de Prometheus.
+Sin dependencias externas: contadores, gauges e histogramas con etiquetas.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional, Sequence
+
+from starlette.routing import Match
+
+# Buckets por defecto (segundos) para latencias HTTP
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _render_samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Contador monotónico."""
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _render_samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Valor instantáneo que puede subir y bajar."""
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def _render_samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Histograma de buckets fijos (acumulativos al exponer)."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [conteos por bucket..., +Inf] , suma
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            state[1] += value
+
+    def _render_samples(self):
+        with self._lock:
+            items = [(k, list(v[0]), v[1]) for k, v in self._values.items()]
+        lines = []
+        names = self.labelnames + ("le",)
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# ============== MÉTRICAS DE LA APLICACIÓN ==============
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "Peticiones HTTP por ruta y código", ("method", "route", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Latencia de peticiones HTTP", ("method", "route", "status")))
+HTTP_DB_QUERIES = REGISTRY.register(Histogram(
+    "http_request_db_queries", "Consultas SQL por petición", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)))
+HTTP_DB_SECONDS = REGISTRY.register(Histogram(
+    "http_request_db_seconds", "Tiempo en base de datos por petición", ("route",)))
+DB_QUERIES = REGISTRY.register(Counter(
+    "db_queries_total", "Consultas SQL ejecutadas"))
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Duración de cada consulta SQL",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)))
+DB_READ_SESSIONS = REGISTRY.register(Counter(
+    "db_read_sessions_total", "Sesiones de lectura por destino y motivo", ("target", "reason")))
+OPTIMIZER_SOLVE_SECONDS = REGISTRY.register(Histogram(
+    "optimizer_solve_seconds", "Duración de calculate_schedule"))
+OPTIMIZER_TASKS = REGISTRY.register(Histogram(
+    "optimizer_tasks", "Tareas consideradas por optimización",
+    buckets=(0, 5, 10, 25, 50, 100, 250, 1000, 10000)))
+OPTIMIZER_PROPOSALS = REGISTRY.register(Histogram(
+    "optimizer_proposals", "Propuestas generadas por optimización",
+    buckets=(0, 5, 10, 25, 50, 100, 250, 1000, 10000)))
+RATE_LIMIT_REJECTIONS = REGISTRY.register(Counter(
+    "rate_limit_rejections_total", "Peticiones rechazadas por rate limiting", ("route",)))
+
+APP_IMPORT_SECONDS = REGISTRY.register(Gauge(
+    "app_import_seconds", "Tiempo de importación de main.py"))
+APP_STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "app_startup_seconds", "Tiempo desde la importación de main.py hasta aceptar tráfico"))
+
+# ============== CONTEXTO POR PETICIÓN ==============
+
+# [nº consultas, segundos] de la petición en curso (mutable: se comparte con el threadpool)
+_request_db_stats: ContextVar[Optional[list]] = ContextVar("request_db_stats", default=None)
+
+
+def record_query(elapsed: float):
+    """Registra una consulta SQL (llamado desde los eventos del engine)."""
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.observe(elapsed)
+    stats = _request_db_stats.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def route_label(scope, routes=()) -> str:
+    """
+    Plantilla de la ruta (p. ej. /tasks/{task_id}) para no disparar la cardinalidad.
+    Las respuestas anteriores al enrutado (503 de admisión, respuestas idempotentes
+    repetidas) no tienen scope["route"]: la plantilla se busca en `routes`. Solo
+    las rutas desconocidas quedan como "unmatched".
+    """
+    route = scope.get("route")
+    if route is None:
+        for candidate in routes:
+            if candidate.matches(scope)[0] is not Match.NONE:
+                route = candidate
+                break
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro: latencia, códigos y consultas SQL por ruta."""
+
+    def __init__(self, app, routes=()):
+        self.app = app
+        self.routes = routes  # Rutas de la app, para etiquetar respuestas previas al enrutado
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = [0, 0.0]
+        token = _request_db_stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db_stats.reset(token)
+            route = route_label(scope, self.routes)
+            labels = (scope["method"], route, str(status_code))
+            HTTP_REQUESTS.inc(*labels)
+            HTTP_LATENCY.observe(elapsed, *labels)
+            HTTP_DB_QUERIES.observe(stats[0], route)
+            HTTP_DB_SECONDS.observe(stats[1], route)
@@ -0,0 +1,206 @@
+"""
+OpoCalendar ASGI Middleware
+Middleware ASGI puros (sin BaseHTTPMiddleware): no crean tareas extra ni
+almacenan la respuesta completa, así que funcionan con respuestas en streaming.
+
+- SecurityHeadersMiddleware: añade cabeceras de seguridad precalculadas.
+- CompressionMiddleware: negocia zstd (más rápido, si está instalado
+  `zstandard`) o gzip y comprime por fragmentos.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional: sin él solo se ofrece gzip
+    zstandard = None
+
+# ============== CABECERAS DE SEGURIDAD ==============
+
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",  # Previene MIME type sniffing
+    "X-Frame-Options": "DENY",  # Respuesta no puede ser framed
+    "X-XSS-Protection": "1; mode=block",  # Protección XSS histórica
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",  # HSTS
+    "Content-Security-Policy": "default-src 'self'; script-src 'self' 'unsafe-inline'",  # CSP
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+}
+
+
+class SecurityHeadersMiddleware:
+    """Inyecta las cabeceras de seguridad (ya codificadas) en http.response.start."""
+
+    def __init__(self, app, headers: dict = SECURITY_HEADERS):
+        self.app = app
+        self.raw_headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+        self.names = frozenset(name for name, _ in self.raw_headers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # Igual que antes: nuestras cabeceras sustituyen a las de la respuesta
+                headers = [h for h in message.get("headers", ()) if h[0] not in self.names]
+                headers.extend(self.raw_headers)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+# ============== COMPRESIÓN ==============
+
+COMPRESSIBLE_TYPES = (
+    b"text/",
+    b"application/json",
+    b"application/javascript",
+    b"application/xml",
+    b"application/problem+json",
+    b"image/svg+xml",
+)
+
+
+class _GzipStream:
+    encoding = b"gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = cabecera gzip
+
+    def chunk(self, data: bytes) -> bytes:
+        # Z_SYNC_FLUSH: el cliente puede descomprimir lo enviado sin esperar al final
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _ZstdStream:
+    encoding = b"zstd"
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+def _accepted_encodings(accept_encoding: bytes) -> set:
+    """Codificaciones aceptadas por el cliente (ignora las que tienen q=0)."""
+    accepted = set()
+    for part in accept_encoding.lower().split(b","):
+        token, _, params = part.strip().partition(b";")
+        params = params.replace(b" ", b"")
+        if params.startswith(b"q=") and params[2:] in (b"0", b"0.0", b"0.00", b"0.000"):
+            continue
+        if token:
+            accepted.add(token)
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Compresión negociada por Accept-Encoding: zstd si está disponible, si no gzip.
+    Las respuestas de un solo fragmento menores que minimum_size se envían tal cual;
+    las respuestas en streaming se comprimen fragmento a fragmento.
+    """
+
+    def __init__(self, app, minimum_size: int = 1000, gzip_level: int = 6, zstd_level: int = 3):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+
+    def _choose(self, scope):
+        if scope["method"] == "HEAD":
+            return None
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accepted = _accepted_encodings(value)
+                if zstandard is not None and b"zstd" in accepted:
+                    return lambda: _ZstdStream(self.zstd_level)
+                if b"gzip" in accepted or b"*" in accepted:
+                    return lambda: _GzipStream(self.gzip_level)
+                return None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        make_stream = self._choose(scope)
+        if make_stream is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        stream = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, stream, passthrough
+            message_type = message["type"]
+
+            if message_type == "http.response.start":
+                headers = message.get("headers", ())
+                content_type = b""
+                for key, value in headers:
+                    if key == b"content-encoding":
+                        passthrough = True  # Ya viene comprimida
+                    elif key == b"content-type":
+                        content_type = value
+                if message["status"] in (204, 304) or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message  # Se decide al ver el primer fragmento
+                return
+
+            if message_type != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                headers = [h for h in start_message.get("headers", ()) if h[0] != b"content-length"]
+                if not more_body and len(body) < self.minimum_size:
+                    # Respuesta pequeña de un solo fragmento: no compensa comprimir
+                    passthrough = True
+                    headers = list(start_message.get("headers", ()))
+                    headers.append((b"vary", b"Accept-Encoding"))
+                    start_message["headers"] = headers
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+
+                stream = make_stream()
+                headers.append((b"content-encoding", stream.encoding))
+                headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    body = stream.finish(body)
+                    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                    start_message["headers"] = headers
+                    await send(start_message)
+                    start_message = None
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                start_message["headers"] = headers
+                await send(start_message)
+                start_message = None
+                await send({"type": "http.response.body", "body": stream.chunk(body), "more_body": True})
+                return
+
+            if more_body:
+                await send({"type": "http.response.body", "body": stream.chunk(body), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": stream.finish(body)})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,268 @@
+"""
+OpoCalendar Profiling Module
+Perfilado bajo demanda de peticiones concretas (yappi o cProfile + tiempos SQL).
+
+Se activa con PROFILING_ENABLED=1 y PROFILING_TOKEN; cada petición que envíe
+la cabecera X-Profile-Token con ese valor se perfila y se guarda en un anillo
+acotado de ficheros en PROFILE_DIR. Si no está activado no se instala nada.
+
+Aislamiento: con `yappi` instalado el perfil se limita a la petición
+perfilada. Su id de contexto sale de una ContextVar, que el threadpool copia,
+así que incluye también las dependencias y endpoints síncronos, y excluye
+al resto de corrutinas del event loop. Sin `yappi` se usa cProfile como
+respaldo. Ese perfil mezcla todo lo que se ejecute en el hilo del event loop
+mientras dura la petición y no ve el threadpool. En ambos casos el .json
+registra cuántas peticiones se solaparon (overlapping_requests).
+"""
+import asyncio
+import cProfile
+import hmac
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar, copy_context
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import event
+
+try:
+    import yappi
+except ImportError:  # yappi es opcional: sin él se usa cProfile (sin aislamiento)
+    yappi = None
+
+logger = logging.getLogger("profiling")
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes") and bool(PROFILING_TOKEN)
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "20"))
+PROFILE_HEADER = b"x-profile-token"
+
+if os.getenv("PROFILING_ENABLED") and not PROFILING_TOKEN:
+    logger.warning("PROFILING_ENABLED sin PROFILING_TOKEN: el perfilado queda desactivado")
+
+# Nombres válidos de perfil (evita path traversal en la descarga)
+_NAME_RE = re.compile(r"^[0-9]+-[A-Z]+-[a-z0-9_-]*\.(prof|json)$")
+
+# Consultas SQL de la petición perfilada en curso
+_sql_log: ContextVar[Optional[list]] = ContextVar("profiling_sql_log", default=None)
+
+# Id de la petición perfilada (0 fuera de ella) y contextos de yappi que ha
+# usado: uno por hilo, porque yappi asocia cada contexto a un único hilo
+_profile_ctx: ContextVar[int] = ContextVar("profiling_request_id", default=0)
+_ctx_ids = itertools.count(1)
+_request_contexts: dict = {}
+
+
+def _yappi_context_id() -> int:
+    request_id = _profile_ctx.get()
+    thread_id = threading.get_ident()
+    if not request_id:
+        return thread_id  # Fuera de la petición, cada hilo es su propio contexto
+    ctx_id = _request_contexts.get((request_id, thread_id))
+    if ctx_id is None:
+        ctx_id = _request_contexts[(request_id, thread_id)] = next(_ctx_ids)
+    return ctx_id
+
+
+# Un único perfil activo a la vez (cProfile y yappi son globales)
+_profile_lock = threading.Lock()
+
+# Peticiones en curso e iniciadas, para medir el solapamiento con la perfilada
+_traffic = {"active": 0, "started": 0}
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Comprueba el token de administración de perfiles."""
+    return ENABLED and bool(token) and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+def install_sql_hook(engine):
+    """Registra las consultas SQL (sentencia + duración) de la petición perfilada."""
+    @event.listens_for(engine, "after_cursor_execute")
+    def _profile_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        log = _sql_log.get()
+        if log is not None:
+            started = getattr(context, "_query_start", None)
+            elapsed_ms = (time.perf_counter() - started) * 1000 if started else None
+            log.append({"statement": statement, "ms": elapsed_ms})
+
+
+def _slug(path: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", path.lower()).strip("-")[:60] or "root"
+
+
+def _prune():
+    """Mantiene como máximo PROFILE_MAX_FILES perfiles (borra los más antiguos)."""
+    profiles = sorted(PROFILE_DIR.glob("*.prof"))
+    for old in profiles[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else profiles:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".json").unlink(missing_ok=True)
+
+
+class _CProfileRecorder:
+    """Respaldo: perfila todo el hilo del event loop mientras dura la petición."""
+    isolated = False
+    name = "cProfile"
+
+    def start(self):
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def stop(self):
+        self._profiler.disable()
+
+    def dump(self, path: Path):
+        self._profiler.dump_stats(path)
+
+
+class _YappiRecorder:
+    """Perfil aislado: solo las funciones ejecutadas en el contexto de la petición."""
+    isolated = True
+    name = "yappi"
+
+    def __init__(self, request_id: int):
+        self.request_id = request_id
+
+    def start(self):
+        yappi.clear_stats()
+        yappi.set_clock_type("wall")
+        yappi.set_context_id_callback(_yappi_context_id)
+        yappi.start(builtins=False, profile_threads=True)
+
+    def stop(self):
+        yappi.stop()
+
+    def dump(self, path: Path):
+        contexts = {ctx for (request_id, _), ctx in list(_request_contexts.items()) if request_id == self.request_id}
+        try:
+            stats = yappi.get_func_stats(filter_callback=lambda stat: stat.ctx_id in contexts)
+            stats.save(str(path), type="pstat")
+        finally:
+            yappi.set_context_id_callback(None)
+            yappi.clear_stats()
+            _request_contexts.clear()
+
+
+def _save(name: str, recorder, meta: dict):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    recorder.dump(PROFILE_DIR / f"{name}.prof")
+    (PROFILE_DIR / f"{name}.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    _prune()
+
+
+def list_profiles() -> list[dict]:
+    """Perfiles disponibles, del más reciente al más antiguo."""
+    if not PROFILE_DIR.exists():
+        return []
+    result = []
+    for prof in sorted(PROFILE_DIR.glob("*.prof"), reverse=True):
+        meta_path = prof.with_suffix(".json")
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            meta = {}
+        result.append({
+            "name": prof.name,
+            "size": prof.stat().st_size,
+            "sql": meta_path.name,
+            "method": meta.get("method"),
+            "path": meta.get("path"),
+            "status": meta.get("status"),
+            "duration_ms": meta.get("duration_ms"),
+            "sql_queries": len(meta.get("sql", [])),
+            "profiler": meta.get("profiler"),
+            "overlapping_requests": meta.get("overlapping_requests"),
+        })
+    return result
+
+
+def profile_path(name: str) -> Optional[Path]:
+    """Ruta de un fichero de perfil existente, o None si el nombre no es válido."""
+    if not _NAME_RE.match(name):
+        return None
+    path = PROFILE_DIR / name
+    return path if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI puro: perfila solo las peticiones con el token de admin."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = None
+        for key, value in scope["headers"]:
+            if key == PROFILE_HEADER:
+                token = value.decode("latin-1")
+                break
+        if token is None or not is_admin(token) or not _profile_lock.acquire(blocking=False):
+            await self._track(scope, receive, send)
+            return
+
+        name = f"{time.time_ns() // 1_000_000}-{scope['method']}-{_slug(scope['path'])}"
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", f"{name}.prof".encode())]
+            await send(message)
+
+        sql_log = []
+        sql_token = _sql_log.set(sql_log)
+        request_id = next(_ctx_ids)
+        # La petición corre en una tarea propia cuyo contexto ya lleva el id: así
+        # todas sus llamadas (y las del threadpool, que copia el contexto) empiezan
+        # y terminan en el mismo contexto de yappi
+        context = copy_context()
+        context.run(_profile_ctx.set, request_id)
+        recorder = _YappiRecorder(request_id) if yappi is not None else _CProfileRecorder()
+        others_active = _traffic["active"]
+        started_before = _traffic["started"]
+        start = time.perf_counter()
+        try:
+            recorder.start()
+            try:
+                loop = asyncio.get_running_loop()
+                await context.run(loop.create_task, self._track(scope, receive, send_wrapper))
+            finally:
+                recorder.stop()
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            _sql_log.reset(sql_token)
+            try:
+                _save(name, recorder, {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                    "duration_ms": duration_ms,
+                    "profiler": recorder.name,
+                    "isolated": recorder.isolated,
+                    # Peticiones en curso al empezar + iniciadas durante la perfilada
+                    "overlapping_requests": others_active + _traffic["started"] - started_before - 1,
+                    "sql": sql_log,
+                })
+            except OSError:
+                logger.exception("No se pudo guardar el perfil %s", name)
+            finally:
+                _profile_lock.release()
+
+    async def _track(self, scope, receive, send):
+        _traffic["active"] += 1
+        _traffic["started"] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _traffic["active"] -= 1
@@ -5,7 +5,14 @@ from sqlalchemy.pool import StaticPool
 from datetime import date
 
 from database import Base, get_db
-from main import app
+from main import app, get_read_db
+import database, models
+import pytest
+import ai_service, schemas, metrics, profiling, admission, idempotency
+import asyncio
+import zlib
+from middleware import CompressionMiddleware, SecurityHeadersMiddleware
+from fastapi.middleware.cors import CORSMiddleware
 
 # --- CONFIGURACIÓN DB PRUEBAS (SQLite Memoria) ---
 SQLALCHEMY_DATABASE_URL = "sqlite://"
@@ -25,6 +32,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 client = TestClient(app)
 
 def setup_module(module):
@@ -37,6 +45,36 @@ def test_read_root():
     assert response.status_code == 200
     assert response.json()["estado"] == "Funcionando 🚀"
 
+def test_health_liveness_and_readiness(monkeypatch):
+    import main, os
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    from sqlalchemy import text
+
+    monkeypatch.setattr(database, "engine", engine)  # BD de pruebas creada con create_all
+    monkeypatch.setattr(main, "_schema_ready", False)
+    local_client = TestClient(app, base_url="http://localhost")  # Host permitido por TrustedHost
+    assert local_client.get("/health/live").status_code == 200
+
+    # Sin tabla alembic_version: migraciones pendientes
+    response = local_client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "not_ready", "reason": "Migraciones pendientes"}
+
+    # Marcada en la última migración: lista
+    config = Config(os.path.join(os.path.dirname(database.__file__), "alembic.ini"))
+    head = ScriptDirectory.from_config(config).get_current_head()
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO alembic_version VALUES (:head)"), {"head": head})
+    try:
+        response = local_client.get("/health/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE alembic_version"))
+
 def test_create_task_happy_path():
     response = client.post("/tasks", json={
         "title": "Estudiar Constitución",
@@ -83,6 +121,37 @@ def test_update_task_not_found():
     response = client.put("/tasks/999", json={"title": "Fantasma"})
     assert response.status_code == 404
 
+def test_reads_stay_fast_while_optimize_gate_is_saturated(monkeypatch):
+    import httpx, time, main
+    from auth import get_current_user
+
+    def slow_solver(db, target_date, req, user_id=None):
+        time.sleep(0.3)  # CPU del solver: bloquea el hilo que lo ejecuta
+        return []
+
+    monkeypatch.setattr(ai_service, "calculate_schedule", slow_solver)
+    monkeypatch.setattr(main.limiter, "enabled", False)
+    monkeypatch.setitem(app.dependency_overrides, get_current_user, lambda: {"user_id": 1, "username": "lector"})
+    payload = {"day_start": "08:00", "day_end": "22:00", "breaks": []}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as http:
+            # 2 en ejecución + 2 en cola: la clase optimize queda saturada
+            solves = [asyncio.ensure_future(http.post(f"/optimize/calculate/{date.today()}", json=payload))
+                      for _ in range(4)]
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            read = await http.get("/tasks")
+            read_seconds = time.perf_counter() - started
+            return read, read_seconds, await asyncio.gather(*solves)
+
+    read, read_seconds, solves = asyncio.run(scenario())
+    assert read.status_code == 200
+    assert read_seconds < 0.15  # no espera a que termine ningún solve
+    assert [r.status_code for r in solves] == [200] * 4
+
+
 def test_optimize_endpoint_structure():
     today = str(date.today())
     payload = {
@@ -94,6 +163,43 @@ def test_optimize_endpoint_structure():
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
+def test_optimize_lean_loader_uses_minutes():
+    from datetime import time
+    day = date(2031, 5, 20)  # Día y usuario propios: no depende de los tests anteriores
+    db = TestingSessionLocal()
+    try:
+        def add(title, priority, start, end, duration, is_fixed=False, completed=False, user_id=99):
+            db.add(models.Task(user_id=user_id, title=title, priority=priority, date=day,
+                               start_time=start, end_time=end, duration=duration,
+                               is_fixed=is_fixed, completed=completed))
+        add("Clase", "medium", time(10, 0), time(11, 0), 60, is_fixed=True)
+        add("Repaso", "low", time(18, 0), time(18, 30), 30)
+        add("Temario", "high", time(19, 0), time(20, 0), 60)
+        add("Simulacro", "medium", time(16, 0), time(17, 30), 90)
+        add("Hecha", "high", time(9, 0), time(10, 0), 60, completed=True)
+        add("Ajena", "high", time(9, 0), time(10, 0), 60, user_id=98)
+        db.commit()
+
+        tasks = {t.title: t for t in ai_service.load_day_tasks(db, day, user_id=99)}
+        assert set(tasks) == {"Clase", "Repaso", "Temario", "Simulacro"}
+        assert (tasks["Clase"].start, tasks["Clase"].end, tasks["Clase"].is_fixed) == (600, 660, True)
+        assert (tasks["Repaso"].start, tasks["Repaso"].end, tasks["Repaso"].rank) == (1080, 1110, 1)
+        assert tasks["Temario"].rank == 3 and tasks["Temario"].old_start == time(19, 0)
+
+        proposals = ai_service.calculate_schedule(db, day, schemas.OptimizationRequest(
+            day_start="08:00", day_end="12:00"
+        ), user_id=99)
+        # Hueco 08:00-10:00: primero la de mayor prioridad; la de 90 min no cabe en ningún hueco
+        assert [(p["title"], p["new_start"], p["new_end"]) for p in proposals] == [
+            ("Temario", time(8, 0), time(9, 0)),
+            ("Repaso", time(9, 0), time(9, 30)),
+        ]
+    finally:
+        db.rollback()
+        db.query(models.Task).filter(models.Task.date == day).delete()
+        db.commit()
+        db.close()
+
 def test_optimize_apply_changes():
     # Enviar propuesta válida según schema TaskProposal
     propuesta = [{
@@ -120,4 +226,325 @@ def test_delete_task_success():
 
 def test_delete_task_not_found():
     response = client.delete("/tasks/1")
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+def test_metrics_histogram_exposition():
+    hist = metrics.Histogram("test_latency_seconds", "Latencia de prueba", ("route",), buckets=(0.1, 1.0))
+    hist.observe(0.05, "/tasks")
+    hist.observe(2.0, "/tasks")
+    text = hist.render()
+    assert 'test_latency_seconds_bucket{route="/tasks",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/tasks",le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count{route="/tasks"} 2' in text
+
+
+def test_metrics_endpoint_labels_routes_and_db_queries(monkeypatch):
+    import main
+    from auth import create_access_token
+
+    database.instrument_engine(engine)  # La BD de pruebas también cuenta consultas
+    monkeypatch.setattr(main, "METRICS_TOKEN", "tok")
+    monkeypatch.setattr(main.limiter, "enabled", False)
+    local_client = TestClient(app, base_url="http://localhost")
+    auth_headers = {"Authorization": f"Bearer {create_access_token({'sub': '1'})}"}
+
+    def sample(name):
+        body = local_client.get("/metrics", headers={"X-Metrics-Token": "tok"}).text
+        for line in body.splitlines():
+            if line.startswith(name + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    reads = 'http_requests_total{method="GET",route="/tasks",status="200"}'
+    writes = 'http_requests_total{method="POST",route="/tasks",status="200"}'
+    queries = 'http_request_db_queries_sum{route="/tasks"}'
+    before = {name: sample(name) for name in (reads, writes, queries)}
+
+    assert local_client.get("/tasks", headers=auth_headers).status_code == 200
+    # El duplicado lo responde el middleware de idempotencia, antes del enrutado
+    task = {"title": "Métricas", "description": "", "type": "study", "priority": "low",
+            "date": "2031-05-21", "start_time": "09:00:00", "end_time": "10:00:00", "duration": 60,
+            "is_fixed": False, "email_reminder": False, "repeat_weekly": False, "completed": False}
+    headers = {**auth_headers, "Idempotency-Key": "metrics-1"}
+    assert local_client.post("/tasks", json=task, headers=headers).status_code == 200
+    assert local_client.post("/tasks", json=task, headers=headers).headers["idempotent-replayed"] == "true"
+
+    assert local_client.get("/metrics").status_code == 404  # Sin X-Metrics-Token
+    assert sample(reads) == before[reads] + 1
+    assert sample(writes) == before[writes] + 2  # La repetida también lleva la plantilla
+    assert sample(queries) >= before[queries] + 2  # Lectura y escritura, pero no la repetida
+    assert metrics.route_label({"type": "http", "method": "GET", "path": "/nada", "root_path": ""},
+                               app.router.routes) == "unmatched"
+
+def test_profile_download_rejects_invalid_names():
+    assert profiling.profile_path("../main.py") is None
+    assert profiling.profile_path("1-GET-tasks.prof/../../x") is None
+    assert profiling.is_admin("") is False
+
+
+def test_profiling_isolates_the_profiled_request(tmp_path, monkeypatch):
+    pytest.importorskip("yappi")
+    import pstats
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "tok")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+
+    def profiled_work():
+        return sum(range(1000))
+
+    def other_work():
+        return sum(range(1000))
+
+    async def app(scope, receive, send):
+        for _ in range(3):
+            (profiled_work if scope["path"] == "/target" else other_work)()
+            await asyncio.sleep(0)  # cede el event loop a la otra petición
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = profiling.ProfilingMiddleware(app)
+
+    async def request(path, headers):
+        async def send(message):
+            pass
+        await middleware({"type": "http", "method": "GET", "path": path, "headers": headers}, None, send)
+
+    async def scenario():
+        await asyncio.gather(request("/target", [(b"x-profile-token", b"tok")]), request("/other", []))
+
+    asyncio.run(scenario())
+    meta = profiling.list_profiles()[0]
+    assert meta["profiler"] == "yappi" and meta["overlapping_requests"] == 1
+    functions = {name for _, _, name in pstats.Stats(str(tmp_path / meta["name"])).stats}
+    assert "profiled_work" in functions and "other_work" not in functions
+
+
+def test_read_replica_routing_with_two_sqlite_files(tmp_path, monkeypatch):
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for eng in (primary, replica):
+        Base.metadata.create_all(bind=eng)
+    with primary.begin() as conn:
+        conn.execute(models.User.__table__.insert(), {"id": 1, "username": "ana", "email": "a@x.com", "hashed_password": "x"})
+    monkeypatch.setattr(database, "engine", primary)
+    monkeypatch.setattr(database, "read_engine", replica)
+    monkeypatch.setattr(database, "_replica_state", {"down_until": 0.0, "lag_checked_at": 0.0})
+
+    def count_users(last_write=None):
+        db = database.open_read_session(last_write)
+        try:
+            return db.query(models.User).count()
+        finally:
+            db.close()
+
+    # Sin escrituras recientes se lee de la réplica (aún vacía)
+    assert count_users() == 0
+    # Read-your-writes: el cliente reenvía la marca X-Last-Write de su escritura
+    marker = database.write_marker()
+    assert count_users(marker) == 1
+    # Marcas caducadas, del futuro o inválidas no cuentan
+    assert count_users(str(float(marker) - database.READ_YOUR_WRITES_SECONDS - 1)) == 0
+    assert count_users(str(float(marker) + 3600)) == 0
+    assert count_users("abc") == 0
+
+    # Réplica caída: respaldo en la primaria
+    monkeypatch.setattr(database, "read_engine", create_engine(f"sqlite:///{tmp_path / 'no_existe' / 'r.db'}"))
+    assert count_users() == 1
+
+    # Las sesiones de lectura no permiten escribir
+    db = database.open_read_session()
+    db.add(models.User(username="bob", email="b@x.com", hashed_password="x"))
+    with pytest.raises(RuntimeError):
+        db.flush()
+    db.close()
+
+
+def test_admission_gate_queues_then_sheds():
+    async def scenario():
+        gate = admission.Gate("optimize", limit=1, queue_size=1, timeout=0.05)
+        await gate.acquire()                      # ocupa la única plaza
+        queued = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(admission.Rejected) as full:
+            await gate.acquire()                  # cola llena -> rechazo inmediato
+        assert full.value.reason == "queue_full"
+        gate.release()                            # la plaza pasa a la petición en cola
+        await queued
+        assert gate.active == 1
+        with pytest.raises(admission.Rejected) as late:
+            await gate.acquire()                  # espera más que el plazo
+        assert late.value.reason == "timeout"
+        gate.release()
+        assert gate.active == 0 and not gate.waiters
+
+    asyncio.run(scenario())
+    assert admission.route_class("GET", "/tasks") == "read"
+    assert admission.route_class("POST", "/auth/login") == "auth"
+    assert admission.route_class("GET", "/health/ready") is None
+
+
+def test_admission_middleware_sheds_with_cors_and_retry_after():
+    release = None
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    gates = {"write": admission.Gate("write", limit=1, queue_size=0, timeout=3.0)}
+    app = CORSMiddleware(admission.AdmissionMiddleware(slow_app, gates=gates),
+                         allow_origins=["http://localhost:5173"], expose_headers=["Retry-After"])
+
+    async def post():
+        sent = []
+        async def send(message):
+            sent.append(message)
+        scope = {"type": "http", "method": "POST", "path": "/tasks",
+                 "headers": [(b"origin", b"http://localhost:5173")]}
+        await app(scope, None, send)
+        return sent[0]["status"], dict(sent[0]["headers"])
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.ensure_future(post())   # ocupa la única plaza
+        await asyncio.sleep(0)
+        shed = await post()                     # sin plaza ni cola -> 503
+        release.set()
+        return await first, shed
+
+    (first_status, _), (status, headers) = asyncio.run(scenario())
+    assert first_status == 200
+    assert status == 503
+    assert headers[b"retry-after"] == b"3"
+    assert headers[b"access-control-allow-origin"] == b"http://localhost:5173"
+    assert b"Retry-After" in headers[b"access-control-expose-headers"]
+
+
+def test_asgi_middleware_streams_gzip_and_security_headers():
+    async def streaming_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain"), (b"x-frame-options", b"SAMEORIGIN")]})
+        for i in range(3):
+            await send({"type": "http.response.body", "body": b"fragmento %d " % i * 100, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+    async def send(message):
+        sent.append(message)
+
+    app = SecurityHeadersMiddleware(CompressionMiddleware(streaming_app, minimum_size=10))
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(app(scope, None, send))
+
+    headers = dict(sent[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"x-frame-options"] == b"DENY"
+    assert b"content-length" not in headers
+    # Cada fragmento llega comprimido por separado (no se almacena la respuesta)
+    assert len(sent) == 5
+    body = b"".join(m.get("body", b"") for m in sent[1:])
+    assert zlib.decompress(body, 31) == b"".join(b"fragmento %d " % i * 100 for i in range(3))
+
+
+def test_idempotency_replays_and_waits_for_in_flight():
+    calls = []
+
+    async def create_app(scope, receive, send):
+        message = await receive()
+        calls.append(message["body"])
+        await asyncio.sleep(0.01)  # la escritura sigue en curso cuando llega el duplicado
+        await send({"type": "http.response.start", "status": 201,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"id": 1}'})
+
+    app = idempotency.IdempotencyMiddleware(
+        create_app, identify=lambda auth: "7", store=idempotency.MemoryStore())
+
+    async def post(body, key=b"k-1"):
+        sent = []
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        async def send(message):
+            sent.append(message)
+        scope = {"type": "http", "method": "POST", "path": "/tasks",
+                 "headers": [(b"authorization", b"Bearer t"), (b"idempotency-key", key)]}
+        await app(scope, receive, send)
+        return sent[0]["status"], dict(sent[0]["headers"]), sent[1]["body"]
+
+    async def scenario():
+        first, duplicate = await asyncio.gather(post(b'{"title": "a"}'), post(b'{"title": "a"}'))
+        retry = await post(b'{"title": "a"}')
+        mismatch = await post(b'{"title": "b"}')
+        return first, duplicate, retry, mismatch
+
+    first, duplicate, retry, mismatch = asyncio.run(scenario())
+    assert calls == [b'{"title": "a"}']  # el endpoint solo se ejecuta una vez
+    assert first[0] == 201 and b"idempotent-replayed" not in first[1]
+    assert duplicate == retry == (201, {**first[1], b"idempotent-replayed": b"true"}, b'{"id": 1}')
+    assert mismatch[0] == 422
+
+
+def test_idempotency_store_failure_still_sends_the_response():
+    import sqlite3
+
+    class LockedStore(idempotency.MemoryStore):
+        async def put(self, key, entry):
+            raise sqlite3.OperationalError("database is locked")
+
+    async def create_app(scope, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b'{"id": 1}'})
+
+    app = idempotency.IdempotencyMiddleware(create_app, identify=lambda auth: "7", store=LockedStore())
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/tasks",
+             "headers": [(b"authorization", b"Bearer t"), (b"idempotency-key", b"k-3")]}
+    asyncio.run(app(scope, receive, send))
+    assert sent[0]["status"] == 201 and sent[1]["body"] == b'{"id": 1}'
+    assert 'idempotency_store_errors_total{operation="put"} 1\n' in metrics.REGISTRY.render()
+
+def test_idempotency_sqlite_store_coordinates_workers(tmp_path):
+    calls = []
+
+    async def create_app(scope, receive, send):
+        await receive()
+        calls.append(scope["path"])
+        await asyncio.sleep(0.1)  # el duplicado llega al otro worker mientras tanto
+        await send({"type": "http.response.start", "status": 201,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"id": 1}'})
+
+    path = str(tmp_path / "idempotency.db")
+    # Dos "workers": middleware y conexión SQLite propios, mismo fichero. El claim
+    # dura menos que la petición: solo sigue vivo si se renueva mientras se ejecuta
+    workers = [idempotency.IdempotencyMiddleware(create_app, identify=lambda auth: "7",
+                                                 store=idempotency.SQLiteStore(path, claim_seconds=0.03))
+               for _ in range(2)]
+
+    async def post(app):
+        sent = []
+        async def receive():
+            return {"type": "http.request", "body": b'{"title": "a"}', "more_body": False}
+        async def send(message):
+            sent.append(message)
+        scope = {"type": "http", "method": "POST", "path": "/tasks",
+                 "headers": [(b"authorization", b"Bearer t"), (b"idempotency-key", b"k-2")]}
+        await app(scope, receive, send)
+        return sent[0]["status"], dict(sent[0]["headers"]).get(b"idempotent-replayed"), sent[1]["body"]
+
+    async def scenario():
+        return await asyncio.gather(post(workers[0]), post(workers[1]))
+
+    results = asyncio.run(scenario())
+    assert calls == ["/tasks"]  # solo un worker ejecuta el endpoint
+    assert sorted(r[1] for r in results if r[1]) == [b"true"]
+    assert all(r[0] == 201 and r[2] == b'{"id": 1}' for r in results)
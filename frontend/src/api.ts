@@ -7,6 +7,20 @@ const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 const formatTimeForInput = (timeStr: string) => timeStr.slice(0, 5);
 const formatTimeForDb = (timeStr: string) => timeStr.length === 5 ? `${timeStr}:00` : timeStr;
 
+/**
+ * Marca de la última escritura (X-Last-Write). Se reenvía en las peticiones
+ * siguientes y, mientras es reciente, el backend lee de la base primaria en
+ * lugar de la réplica (el usuario ve lo que acaba de guardar)
+ */
+let lastWrite: string | null = null;
+
+const rememberLastWrite = (res: Response) => {
+    const marker = res.headers.get('X-Last-Write');
+    if (marker) {
+        lastWrite = marker;
+    }
+};
+
 /**
  * Obtener headers con token de autenticación
  */
@@ -20,10 +34,25 @@ const getAuthHeaders = (): HeadersInit => {
     if (token) {
         headers['Authorization'] = `Bearer ${token}`;
     }
+
+    if (lastWrite) {
+        headers['X-Last-Write'] = lastWrite;
+    }
     
     return headers;
 };
 
+/**
+ * Clave de idempotencia: los reintentos de una misma operación reutilizan la clave
+ * y el backend devuelve la respuesta ya guardada en lugar de repetir la escritura
+ */
+const newIdempotencyKey = (): string => {
+    if (typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function') {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+};
+
 /**
  * Manejar respuesta de la API con renovación de token si es necesario
  */
@@ -87,6 +116,7 @@ const fetchWithAuth = async (endpoint: string, options: RequestInit = {}) => {
             ...options,
             headers: { ...headers, ...options.headers }
         });
+        rememberLastWrite(res);
         
         const data = await handleResponse(res);
         
@@ -97,6 +127,7 @@ const fetchWithAuth = async (endpoint: string, options: RequestInit = {}) => {
                 ...options,
                 headers: { ...headers2, ...options.headers }
             });
+            rememberLastWrite(res2);
             return handleResponse(res2);
         }
         
@@ -196,7 +227,7 @@ export const api = {
         
         return fetchWithAuth('/tasks', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': newIdempotencyKey() },
             body: JSON.stringify(payload)
         });
     },
@@ -239,7 +270,7 @@ export const api = {
     applyOptimization: async (proposals: any[]) => {
         return fetchWithAuth('/optimize/apply', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': newIdempotencyKey() },
             body: JSON.stringify(proposals)
         });
     },